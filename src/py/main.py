@@ -8,6 +8,7 @@ getDialog项目主执行入口
 import sys
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # 添加项目根目录到Python路径
@@ -18,6 +19,32 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 
+def setup_environment(action=None, source="modelscope", model_dir="./models"):
+    """步骤0: 环境准备"""
+    try:
+        from steps.step03_character import setup_qwen_model
+        action = action or "install"
+        logger.info(f"=== 执行环境准备: {action} ===")
+        if action == "install":
+            result = setup_qwen_model.install_dependencies()
+        elif action == "download":
+            result = setup_qwen_model.download_model(source, model_dir=model_dir) is not None
+        elif action == "verify":
+            result = setup_qwen_model.verify_model(model_dir)
+        elif action == "info":
+            result = setup_qwen_model.model_info(model_dir)
+        else:
+            logger.error(f"❌ 暂不支持的操作: {action}")
+            return False
+        if result:
+            logger.info("✅ 环境准备完成")
+        else:
+            logger.error("❌ 环境准备失败")
+        return result
+    except Exception as e:
+        logger.error(f"❌ 环境准备失败: {e}")
+        return False
+
 def convert_encoding(input_file, output_file=None):
     """步骤1: 编码转换"""
     try:
@@ -69,16 +96,29 @@ def extract_chapters_to_files(input_file, output_dir=None):
         return False
 
 def extract_characters(input_file, output_file=None):
-    """步骤3: 人物名称提取"""
+    """步骤3: 人物名称提取，输入为章节文件提取生成的小说目录时逐章并发处理"""
     try:
         from steps.step03_character import character_extractor
         logger.info("=== 执行人物名称提取 ===")
         
-        # 创建提取器
-        extractor = character_extractor.QwenCharacterExtractor()
-        
-        # 处理文件
-        result = extractor.process_file(input_file, output_file)
+        # 创建提取器，处理完成后关闭与模型服务的连接
+        with character_extractor.QwenCharacterExtractor() as extractor:
+            input_path = Path(input_file)
+            if input_path.is_dir():
+                # 断点记录在输出目录中，中断后重新运行只处理未完成的章节
+                output_dir = Path(output_file) if output_file else character_extractor.OUTPUT_DIR
+                output_dir.mkdir(parents=True, exist_ok=True)
+                chapter_files = sorted(str(path) for path in input_path.rglob("第*章.txt"))
+                if not chapter_files:
+                    logger.error(f"目录中没有章节文件: {input_file}")
+                    return False
+                results = extractor.process_files(
+                    chapter_files, str(output_dir),
+                    checkpoint_file=str(output_dir / "characters_checkpoint.jsonl")
+                )
+                result = all(results.values())
+            else:
+                result = extractor.process_file(input_file, output_file)
         if result:
             logger.info("✅ 人物名称提取完成")
         else:
@@ -88,9 +128,58 @@ def extract_characters(input_file, output_file=None):
         logger.error(f"❌ 人物名称提取失败: {e}")
         return False
 
+def run_pipeline(input_file, output=None):
+    """完整流程: 编码转换后执行章节识别、章节文件提取和人物名称提取"""
+    logger.info("=== 开始完整流程 ===")
+    
+    # 编码转换（只替换文件名后缀，不影响目录名中的 .txt）
+    input_path = Path(input_file)
+    encoding_output = str(input_path.with_stem(input_path.stem + '_utf8'))
+    if not convert_encoding(input_file, encoding_output):
+        return False
+    
+    # 章节识别、章节文件提取、人物名称提取都只读取转换后的文件，互不依赖，
+    # 并行执行，使本地解析与等待模型服务的时间重叠
+    stages = [extract_chapters, extract_chapters_to_files, extract_characters]
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        futures = [executor.submit(stage, encoding_output, output) for stage in stages]
+        results = [future.result() for future in futures]
+    if not all(results):
+        return False
+    
+    logger.info("✅ 完整流程执行完成")
+    return True
 
-def main():
-    """主函数，处理命令行参数"""
+
+# 步骤名 -> 执行函数，各函数签名均为 (input_file, output)
+STEPS = {
+    "encoding": convert_encoding,
+    "chapter": extract_chapters,
+    "extract": extract_chapters_to_files,
+    "character": extract_characters,
+    "all": run_pipeline,
+}
+
+
+def run(step, input_file, output=None):
+    """
+    以编程方式执行指定步骤，不经过命令行解析，供测试或 Web 处理函数直接调用
+    
+    Args:
+        step: 步骤名，见 STEPS
+        input_file: 输入文件路径
+        output: 输出文件/目录路径
+        
+    Returns:
+        bool: 执行是否成功
+    """
+    if step not in STEPS:
+        raise ValueError(f"未知步骤: {step}")
+    return STEPS[step](input_file, output)
+
+
+def _build_parser():
+    """构建命令行参数解析器"""
     parser = argparse.ArgumentParser(
         description="getDialog - 中文小说对话提取工具",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -98,6 +187,7 @@ def main():
 使用示例:
   # 环境准备
   python main.py --step setup --action install
+  python main.py --step setup --action info
   
   # 编码转换
   python main.py --step encoding --input data/ziyang.txt --output data/ziyang_utf8.txt
@@ -111,6 +201,9 @@ def main():
   # 人物名称提取
   python main.py --step character --input data/ziyang_utf8.txt --output output/
   
+  # 逐章人物名称提取（输入为章节文件提取生成的目录，可断点续跑）
+  python main.py --step character --input data/ziyang/ --output output/ziyang/
+  
   
   # 完整流程
   python main.py --step all --input data/ziyang.txt --output output/
@@ -123,7 +216,7 @@ def main():
                        help="执行步骤")
     
     parser.add_argument("--input", "-i",
-                       help="输入文件路径")
+                       help="输入文件路径（character 步骤也可以是章节目录）")
     
     parser.add_argument("--output", "-o", 
                        help="输出文件/目录路径")
@@ -141,51 +234,26 @@ def main():
                        default="./models",
                        help="模型存储目录")
     
-    args = parser.parse_args()
+    return parser
+
+
+# 解析器只在模块导入时构建一次
+_PARSER = _build_parser()
+
+
+def main():
+    """主函数，处理命令行参数"""
+    args = _PARSER.parse_args()
     
     
-    if args.step in ["encoding", "chapter", "extract", "character", "all"] and not args.input:
-        parser.error(f"步骤 {args.step} 需要指定 --input 参数")
+    if args.step in STEPS and not args.input:
+        _PARSER.error(f"步骤 {args.step} 需要指定 --input 参数")
     
     # 执行相应步骤
-    success = False
-    
-    
-    if args.step == "encoding":
-        success = convert_encoding(args.input, args.output)
-    
-    elif args.step == "chapter":
-        success = extract_chapters(args.input, args.output)
-    
-    elif args.step == "extract":
-        success = extract_chapters_to_files(args.input, args.output)
-    
-    elif args.step == "character":
-        success = extract_characters(args.input, args.output)
-    
-    elif args.step == "all":
-        # 执行完整流程
-        logger.info("=== 开始完整流程 ===")
-        
-        # 2. 编码转换
-        encoding_output = args.input.replace('.txt', '_utf8.txt') if args.input else None
-        if not convert_encoding(args.input, encoding_output):
-            sys.exit(1)
-        
-        # 3. 章节识别
-        if not extract_chapters(encoding_output or args.input, args.output):
-            sys.exit(1)
-        
-        # 4. 章节文件提取
-        if not extract_chapters_to_files(encoding_output or args.input, args.output):
-            sys.exit(1)
-        
-        # 5. 人物名称提取
-        if not extract_characters(encoding_output or args.input, args.output):
-            sys.exit(1)
-        
-        logger.info("✅ 完整流程执行完成")
-        success = True
+    if args.step == "setup":
+        success = setup_environment(args.action, args.source, args.model_dir)
+    else:
+        success = run(args.step, args.input, args.output)
     
     if success:
         logger.info("✅ 任务执行成功")
@@ -5,20 +5,131 @@
 """
 
 import os
+import mmap
+import codecs
+import shutil
 from pathlib import Path
-import chardet
 import argparse
 
+# 优先使用 C++ 实现的 cchardet（接口与 chardet 相同，速度快一个数量级），未安装时使用 chardet
+try:
+    from cchardet import UniversalDetector
+except ImportError:
+    from chardet.universaldetector import UniversalDetector
+
 from utils.constants import PROJECT_ROOT
 from utils.log_util import log_info, log_warning, log_error
 
+# 流式转换时每次读取的块大小
+CHUNK_SIZE = 1 << 20
+# 编码检测时每次读取的字节数
+DETECT_CHUNK_SIZE = 64 * 1024
+# 快速编码判断读取的文件开头字节数
+PREFIX_SIZE = 4096
+
+
+def _iter_chunks(file_path, chunk_size):
+    """通过内存映射按块读取文件，由操作系统页缓存负责预读"""
+    if os.path.getsize(file_path) == 0:
+        return
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start in range(0, len(mm), chunk_size):
+            yield mm[start:start + chunk_size]
+
 
 def detect_encoding(file_path):
-    """检测文件编码"""
+    """检测文件编码，分块喂给检测器，结果确定后即停止读取"""
+    detector = UniversalDetector()
+    for chunk in _iter_chunks(file_path, DETECT_CHUNK_SIZE):
+        detector.feed(chunk)
+        if detector.done:
+            break
+    detector.close()
+    return detector.result
+
+
+def guess_encoding_from_prefix(file_path):
+    """
+    根据文件开头快速判断编码，无法确定时返回None
+    
+    中文小说几乎都是 UTF-8 或 GB 系列编码。UTF-8 校验严格，GB 文本几乎不可能
+    通过，因此先试 UTF-8，再试 GB18030（GB2312/GBK 的超集）。
+    """
     with open(file_path, 'rb') as f:
-        raw_data = f.read()
-        result = chardet.detect(raw_data)
-        return result
+        prefix = f.read(PREFIX_SIZE)
+    
+    # 纯 ASCII 无法区分编码
+    if prefix.isascii():
+        return None
+    
+    if prefix.startswith(codecs.BOM_UTF8):
+        return {'encoding': 'utf-8-sig', 'confidence': 1.0}
+    
+    for encoding in ('utf-8', 'gb18030'):
+        try:
+            # 增量解码，允许前缀末尾截断的多字节字符
+            codecs.getincrementaldecoder(encoding)().decode(prefix, final=False)
+        except UnicodeDecodeError:
+            continue
+        return {'encoding': encoding, 'confidence': 1.0}
+    
+    return None
+
+
+def _is_crlf_byte_compatible(encoding):
+    """
+    判断编码中的换行符是否与 ASCII 字节相同
+    
+    GB 系列、UTF-8 等编码的多字节序列不会包含 0x0D/0x0A，
+    可以直接在原始字节上做换行规范化；UTF-16/32 等则不行。
+    """
+    try:
+        return '\r\n'.encode(encoding) == b'\r\n'
+    except (LookupError, TypeError):
+        return False
+
+
+def _is_plain_utf8(encoding):
+    """判断编码是否为不带 BOM 的 UTF-8（ASCII 是其子集）"""
+    try:
+        return codecs.lookup(encoding).name in ('utf-8', 'ascii')
+    except (LookupError, TypeError):
+        return False
+
+
+def _contains_cr(file_path):
+    """判断文件中是否含有 \r 字节"""
+    if os.path.getsize(file_path) == 0:
+        return False
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm.find(b'\r') != -1
+
+
+def _transcode_bytes(input_file, output_file, source_encoding):
+    """在解码前于字节层面把 \r\n 和 \r 统一为 \n，然后解码并写出 UTF-8"""
+    decoder = codecs.getincrementaldecoder(source_encoding)(errors='replace')
+    pending_cr = False
+    with open(output_file, 'wb') as dst:
+        for raw in _iter_chunks(input_file, CHUNK_SIZE):
+            # 块末尾的 \r 可能与下一块开头的 \n 组成 \r\n，留到下一块处理
+            if pending_cr:
+                raw = b'\r' + raw
+            pending_cr = raw.endswith(b'\r')
+            if pending_cr:
+                raw = raw[:-1]
+            raw = raw.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+            dst.write(decoder.decode(raw).encode('utf-8'))
+        
+        tail = b'\n' if pending_cr else b''
+        dst.write(decoder.decode(tail, final=True).encode('utf-8'))
+
+
+def _transcode_text(input_file, output_file, source_encoding):
+    """按文本模式分块转换，由通用换行处理把 \r\n 和 \r 统一为 \n"""
+    with open(input_file, 'r', encoding=source_encoding, errors='replace') as src, \
+            open(output_file, 'w', encoding='utf-8', newline='\n') as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), ''):
+            dst.write(chunk)
 
 
 def convert_to_utf8(input_file, output_file=None, source_encoding=None):
@@ -31,11 +142,11 @@ def convert_to_utf8(input_file, output_file=None, source_encoding=None):
         source_encoding: 源文件编码，如果为None则自动检测
     """
     input_file=Path(PROJECT_ROOT/input_file)
-    # 检测源文件编码
+    # 检测源文件编码：先用文件开头做快速判断，无法确定时再交给 chardet
     if source_encoding is None:
-        encoding_info = detect_encoding(input_file)
+        encoding_info = guess_encoding_from_prefix(input_file) or detect_encoding(input_file)
         source_encoding = encoding_info['encoding']
-        confidence = encoding_info['confidence']
+        confidence = encoding_info['confidence'] or 0.0
         log_info(f"检测到文件编码: {source_encoding} (置信度: {confidence:.2f})")
         
         if confidence < 0.8:
@@ -49,14 +160,23 @@ def convert_to_utf8(input_file, output_file=None, source_encoding=None):
         output_file=Path(PROJECT_ROOT/output_file)
         
     try:
-        # 读取源文件
-        with open(input_file, 'r', encoding=source_encoding, errors='replace') as f:
-            content = f.read()
+        # 覆盖原文件时先写入临时文件，避免边读边写截断源文件
+        in_place = output_file.resolve() == input_file.resolve()
+        target_file = output_file.with_name(output_file.name + '.tmp') if in_place else output_file
         
-        # 写入UTF-8文件
-        with open(output_file, 'w', encoding='utf-8', newline='\n') as f:
-            content = content.replace('\r\n', '\n').replace('\r', '\n')
-            f.write(content)
+        if _is_plain_utf8(source_encoding) and not _contains_cr(input_file):
+            # 已是 UTF-8 且无需换行规范化：直接复制字节（Linux 上走 sendfile），原地转换则无需处理
+            if not in_place:
+                shutil.copyfile(input_file, output_file)
+        else:
+            # 分块流式转换，内存占用与文件大小无关
+            if _is_crlf_byte_compatible(source_encoding):
+                _transcode_bytes(input_file, target_file, source_encoding)
+            else:
+                _transcode_text(input_file, target_file, source_encoding)
+            
+            if in_place:
+                os.replace(target_file, output_file)
         
         log_info(f"转换完成: {input_file} -> {output_file}")
         log_info(f"源编码: {source_encoding} -> 目标编码: UTF-8")
@@ -74,11 +194,21 @@ def convert_to_utf8(input_file, output_file=None, source_encoding=None):
 def verify_conversion(file_path):
     """验证转换结果"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            line_count = len(content.splitlines())
-            char_count = len(content)
-            log_info(f"验证成功: 文件包含 {line_count} 行，{char_count} 个字符")
+        # 分块严格解码校验 UTF-8，不把整个文件读成字符串
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='strict')
+        line_count = 0
+        char_count = 0
+        last_byte = b'\n'
+        for chunk in _iter_chunks(file_path, CHUNK_SIZE):
+            char_count += len(decoder.decode(chunk))
+            line_count += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+        char_count += len(decoder.decode(b'', final=True))
+        
+        # 最后一行没有换行符时也计为一行
+        if last_byte != b'\n':
+            line_count += 1
+        log_info(f"验证成功: 文件包含 {line_count} 行，{char_count} 个字符")
     except UnicodeDecodeError as e:
         log_error(f"验证失败: UTF-8 解码错误 - {e}")
     except Exception as e:
@@ -101,7 +231,6 @@ def main():
     # 创建备份
     if args.backup:
         backup_file = args.input_file + '.bak'
-        import shutil
         shutil.copy2(args.input_file, backup_file)
         log_info(f"已创建备份文件: {backup_file}")
     
@@ -1,14 +1,37 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
+import re
+import mmap
 import argparse
-from typing import List
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from .chapter_visualizer import ChapterStructureVisualizer, Volume
+from .chapter_visualizer import ChapterStructureVisualizer, LineIndex, Volume
 from utils.log_util import log_info, log_error, log_warning
 from utils.constants import PROJECT_ROOT
 
+# 并行写章节文件的线程数
+WRITE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# 卷目录名、章节文件名中的编号
+_NUM_RE = re.compile(r'第(\d+)')
+
+
+def _natural_key(name: str):
+    """按编号数值排序（第2章在第10章之前），没有数字编号的名称排在最后并按字符串排序"""
+    match = _NUM_RE.match(name)
+    return (0, int(match.group(1)), name) if match else (1, 0, name)
+
+
+def _write_text(job):
+    """写出单个文件，job 为 (文件路径字符串, 内容)"""
+    path, content = job
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
 
 class ChapterExtractor:
     """章节内容提取器，将小说按卷和章节分离为单独的文本文件"""
@@ -45,54 +68,64 @@ class ChapterExtractor:
             
             log_info(f"开始提取章节文件到: {novel_dir}")
             
-            # 解析小说结构
-            structure_data = self.visualizer.parse_file(input_file)
-            volumes_data = structure_data['volumes']
-            
-            # 读取原始文件内容
-            with open(input_file, 'r', encoding='utf-8') as f:
-                original_lines = f.readlines()
-            
-            # 提取每个卷和章节
-            total_chapters = 0
-            for vol_data in volumes_data:
-                volume_dir = novel_dir / f"第{vol_data['number']}卷"
-                volume_dir.mkdir(exist_ok=True)
-                
-                log_info(f"处理第{vol_data['number']}卷: {vol_data['title']}")
+            # 内存映射原始文件并建立换行符索引，章节内容按字节区间切片，不再把全文读成行列表
+            # （空文件无法映射）；结构解析复用同一份映射和索引，整个文件只读取一次
+            with open(input_file, 'rb') as f, \
+                    (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                     if os.fstat(f.fileno()).st_size else nullcontext(b'')) as buf:
+                index = LineIndex(buf)
                 
-                # 提取卷的内容（如果有卷标题行）
-                if vol_data['chapters']:
-                    # 创建卷信息文件
-                    volume_info_file = volume_dir / "卷信息.txt"
-                    with open(volume_info_file, 'w', encoding='utf-8') as f:
-                        f.write(f"第{vol_data['number']}卷: {vol_data['title']}\n")
-                        f.write(f"章节数: {len(vol_data['chapters'])}\n")
-                        f.write(f"总字数: {vol_data['total_words']:,}\n")
-                        f.write(f"起始行: {vol_data['start_line']}\n")
-                        f.write(f"结束行: {vol_data['end_line']}\n")
+                # 解析小说结构
+                structure_data = self.visualizer.parse_buffer(buf, input_file, index)
+                volumes_data = structure_data['volumes']
                 
-                # 提取每个章节
-                for chapter_data in vol_data['chapters']:
-                    chapter_filename = f"第{chapter_data['chapter_number']}章.txt"
-                    chapter_file = volume_dir / chapter_filename
+                # 提取每个卷和章节：主线程切分内容，文件写入统一交给线程池并行执行
+                # 循环内的路径直接用字符串拼接，不为每个卷和章节构造 Path 对象
+                # 卷号或章号重复时会得到相同路径，按路径去重，与逐个顺序写入时一样保留最后一份内容，
+                # 避免同一文件被并行写入
+                novel_root = os.fspath(novel_dir)
+                write_jobs = {}
+                total_chapters = 0
+                for vol_data in volumes_data:
+                    volume_dir = f"{novel_root}/第{vol_data.number}卷"
+                    os.makedirs(volume_dir, exist_ok=True)
                     
-                    # 提取章节内容
-                    chapter_content = self._extract_full_chapter_content(
-                        original_lines, chapter_data['start_line'], chapter_data['end_line']
-                    )
+                    log_info(f"处理第{vol_data.number}卷: {vol_data.title}")
                     
-                    # 写入章节文件
-                    with open(chapter_file, 'w', encoding='utf-8') as f:
-                        # 写入章节标题
-                        f.write(f"第{chapter_data['chapter_number']}章: {chapter_data['chapter_title']}\n")
-                        f.write("=" * 50 + "\n\n")
-                        
-                        # 写入章节内容
-                        f.write(chapter_content)
+                    # 提取卷的内容（如果有卷标题行）
+                    if vol_data.chapters:
+                        # 创建卷信息文件，内容拼好后一次写入
+                        volume_info_file = f"{volume_dir}/卷信息.txt"
+                        write_jobs[volume_info_file] = (
+                            f"第{vol_data.number}卷: {vol_data.title}\n"
+                            f"章节数: {len(vol_data.chapters)}\n"
+                            f"总字数: {vol_data.total_words:,}\n"
+                            f"起始行: {vol_data.start_line}\n"
+                            f"结束行: {vol_data.end_line}\n"
+                        )
                     
-                    total_chapters += 1
-                    log_info(f"  提取第{chapter_data['chapter_number']}章: {chapter_data['chapter_title']} -> {chapter_file}")
+                    # 提取每个章节
+                    for chapter_data in vol_data.chapters:
+                        chapter_file = f"{volume_dir}/第{chapter_data.chapter_number}章.txt"
+                        
+                        # 提取章节内容
+                        chapter_content = self._extract_full_chapter_content(
+                            buf, index, chapter_data.start_line, chapter_data.end_line
+                        )
+                        
+                        # 写入章节文件：标题、分隔线和正文拼成一个字符串，一次写入
+                        write_jobs[chapter_file] = (
+                            f"第{chapter_data.chapter_number}章: {chapter_data.chapter_title}\n"
+                            f"{'=' * 50}\n\n"
+                            f"{chapter_content}"
+                        )
+                        
+                        total_chapters += 1
+                        log_info(f"  提取第{chapter_data.chapter_number}章: {chapter_data.chapter_title} -> {chapter_file}")
+            
+            with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+                # 消费结果，使写入异常在主线程抛出
+                list(executor.map(_write_text, write_jobs.items()))
             
             log_info(f"章节提取完成！共提取 {len(volumes_data)} 卷，{total_chapters} 章")
             log_info(f"文件保存在: {novel_dir}")
@@ -103,25 +136,27 @@ class ChapterExtractor:
             log_error(f"章节提取失败: {e}")
             return False
     
-    def _extract_full_chapter_content(self, lines: List[str], start_line: int, end_line: int) -> str:
+    def _extract_full_chapter_content(self, buf, index: LineIndex, start_line: int, end_line: int) -> str:
         """
         提取完整的章节内容
         
         Args:
-            lines: 原始文件的所有行
+            buf: 原始文件字节（bytes 或 mmap）
+            index: 原始文件的换行符位置索引
             start_line: 起始行号（1-based）
             end_line: 结束行号（1-based）
             
         Returns:
             str: 章节内容
         """
-        content_lines = []
+        # 跳过标题行，取第 start_line+1 行到第 end_line+1 行（不超过文件末行）的字节，整段解码一次
+        last_line = min(end_line + 1, index.total_lines)
+        if last_line <= start_line:
+            return ''
+        chunk = buf[index.line_end(start_line) + 1:index.line_end(last_line)].decode('utf-8')
         
-        # 转换为 0-based 索引，并跳过标题行
-        for i in range(start_line, min(end_line + 1, len(lines))):
-            line = lines[i].strip()
-            if line:  # 只保留非空行
-                content_lines.append(line)
+        # 只保留非空行
+        content_lines = [line for line in map(str.strip, chunk.split('\n')) if line]
         
         # 第一行通常是章节标题，我们跳过它
         if content_lines and content_lines[0].startswith('第') and ('章' in content_lines[0]):
@@ -129,6 +164,25 @@ class ChapterExtractor:
         
         return '\n'.join(content_lines)
     
+    @staticmethod
+    def _iter_index_lines(novel_dir: Path, novel_name: str, volume_names):
+        """逐行产出章节索引文件的内容"""
+        yield f"《{novel_name}》章节索引\n"
+        yield "=" * 50 + "\n\n"
+        for volume_name in volume_names:
+            yield f"{volume_name}:\n"
+            
+            # 遍历章节文件，去掉 .txt 扩展名
+            with os.scandir(novel_dir / volume_name) as entries:
+                chapter_names = sorted(
+                    (entry.name[:-4] for entry in entries
+                    if entry.is_file() and entry.name.endswith('.txt') and entry.name.startswith('第')),
+                    key=_natural_key
+                )
+            for chapter_name in chapter_names:
+                yield f"  {chapter_name}\n"
+            yield "\n"
+    
     def create_chapter_index(self, output_base_dir: str, novel_name: str) -> bool:
         """
         创建章节索引文件
@@ -148,24 +202,17 @@ class ChapterExtractor:
                 log_warning(f"小说目录不存在: {novel_dir}")
                 return False
             
+            # os.scandir 直接给出文件名和类型，按编号自然排序，不为每个条目构造 Path 对象
+            with os.scandir(novel_dir) as entries:
+                volume_names = sorted(
+                    (entry.name for entry in entries
+                    if entry.is_dir() and entry.name.startswith('第') and entry.name.endswith('卷')),
+                    key=_natural_key
+                )
+            
+            # 索引内容由生成器逐行产出，一次 writelines 写入，不先拼成完整列表
             with open(index_file, 'w', encoding='utf-8') as f:
-                f.write(f"《{novel_name}》章节索引\n")
-                f.write("=" * 50 + "\n\n")
-                
-                # 遍历卷目录
-                volume_dirs = sorted([d for d in novel_dir.iterdir() if d.is_dir() and d.name.startswith('第') and d.name.endswith('卷')])
-                
-                for volume_dir in volume_dirs:
-                    f.write(f"{volume_dir.name}:\n")
-                    
-                    # 遍历章节文件
-                    chapter_files = sorted([f for f in volume_dir.iterdir() if f.is_file() and f.name.endswith('.txt') and f.name.startswith('第')])
-                    
-                    for chapter_file in chapter_files:
-                        chapter_name = chapter_file.stem  # 去掉 .txt 扩展名
-                        f.write(f"  {chapter_name}\n")
-                    
-                    f.write("\n")
+                f.writelines(self._iter_index_lines(novel_dir, novel_name, volume_names))
             
             log_info(f"章节索引创建完成: {index_file}")
             return True
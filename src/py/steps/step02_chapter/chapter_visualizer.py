@@ -3,11 +3,30 @@
 
 import re
 import json
+import mmap
 import argparse
-from typing import List, Dict, Tuple, Optional
-from dataclasses import dataclass, asdict
+import os
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import List, Dict, Tuple, Optional, NamedTuple
+from dataclasses import dataclass, is_dataclass
 from pathlib import Path
 from utils.log_util import log_info, log_error
+from utils.constants import OUTPUT_DIR
+
+# 安装了 numpy 时用向量化比较构建换行符索引，否则由正则逐个收集
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# 优先使用 orjson（C 实现，原生支持 dataclass，直接输出 UTF-8 字节），未安装时使用标准库 json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 
 @dataclass
@@ -32,150 +51,376 @@ class Volume:
     total_words: int
 
 
+def _json_default(obj):
+    """json.dumps 的 default 回调：dataclass 直接返回其 __dict__，避免 asdict 递归深拷贝"""
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return obj.__dict__
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps_bytes(obj) -> bytes:
+    """把章节结构序列化为缩进 2 格的 UTF-8 JSON 字节"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2, default=_json_default).encode('utf-8')
+
+
+def _dumps(obj) -> str:
+    """把章节结构序列化为缩进 2 格的 JSON 字符串"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, indent=2, default=_json_default)
+
+
+# 标题类型，用整数编码以便分支判断只做整数比较
+VOLUME = 0
+CHAPTER = 1
+
+
+class StructItem(NamedTuple):
+    """卷/章标题行，start_offset/end_offset 为该行在原始字节中的起止位置（不含换行符）"""
+    kind: int
+    line_number: int
+    number_str: str
+    title: str
+    start_offset: int = 0
+    end_offset: int = 0
+
+
+# str.strip() 会去掉的空白字符（str.isspace）的 UTF-8 字节形式，换行符除外
+_WS_BYTES = (
+    rb'(?:[\t\x0b\x0c\r\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80'
+    rb'|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)'
+)
+# 去掉首尾空白后以"第"（\xe7\xac\xac）开头的行，即标题候选行。
+# 以字面量 \n 开头的正则可由引擎快速定位起点，比 (?m)^ 逐字节尝试快得多，第一行单独匹配
+_CANDIDATE_LINE = re.compile(rb'\n(' + _WS_BYTES + rb'*\xe7\xac\xac[^\n]*)')
+_CANDIDATE_FIRST_LINE = re.compile(_WS_BYTES + rb'*\xe7\xac\xac[^\n]*')
+# 空行（只含空白字符的行），同样拆成第一行和其余行两个正则
+_BLANK_LINE = re.compile(rb'\n' + _WS_BYTES + rb'*(?=\n|\Z)')
+_BLANK_FIRST_LINE = re.compile(_WS_BYTES + rb'*(?:\n|\Z)')
+
+
+_NEWLINE = re.compile(rb'\n')
+
+
+class LineIndex:
+    """换行符字节位置索引，构建一次后可按二分查找得到任意位置的行号和任意行的行尾位置"""
+    
+    def __init__(self, buf):
+        self.size = len(buf)
+        if NUMPY_AVAILABLE and self.size:
+            self.newlines = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 0x0A)
+        else:
+            self.newlines = [match.start() for match in _NEWLINE.finditer(buf)]
+        # 最后一行没有换行符时也计为一行
+        self.total_lines = len(self.newlines) + (1 if self.size and buf[-1:] != b'\n' else 0)
+    
+    def line_numbers(self, offsets: List[int]) -> List[int]:
+        """批量查询字节位置所在的行号（从1开始）"""
+        if isinstance(self.newlines, list):
+            return [bisect_left(self.newlines, offset) + 1 for offset in offsets]
+        return (np.searchsorted(self.newlines, offsets) + 1).tolist()
+    
+    def line_end(self, line_number: int) -> int:
+        """第 line_number 行行尾（换行符）的字节位置，超出末行时返回文件长度"""
+        if line_number <= len(self.newlines):
+            return int(self.newlines[line_number - 1])
+        return self.size
+
+
+class ChapterScanner:
+    """卷/章标题扫描器，正则在构建时编译一次，可在多个文件之间复用"""
+    
+    # 卷、章标题合并为一个带命名分组的正则，每行只需匹配一次；
+    # 数字字符类已包含 \d，纯阿拉伯数字的写法无需单独匹配。
+    # 以 fullmatch 整行匹配，无需 ^/$ 锚点；自定义正则需保持相同的分组顺序。
+    # 标准库 re 的 \s、\d 匹配 Unicode 空白和数字，全角空格（U+3000）分隔、全角数字编号的标题同样能识别
+    PATTERN = (
+        r'第(?P<vol_num>[一二三四五六七八九十百千万\d]+)卷\s+(?P<vol_title>.+)'
+        r'|第(?P<ch_num>[一二三四五六七八九十百千万\d]+)章\s+(?P<ch_title>.+)'
+    )
+    
+    def __init__(self, pattern: Optional[str] = None):
+        self.pattern = re.compile(pattern or self.PATTERN)
+    
+    def match(self, line: str) -> Optional[Tuple[int, str, str]]:
+        """匹配单行标题，返回 (类型, 编号, 标题)，不是标题时返回None"""
+        # 标题必以"第"开头，先做字面量前缀过滤，非标题行无需进入正则
+        if not line.startswith('第'):
+            return None
+        match = self.pattern.fullmatch(line)
+        if not match:
+            return None
+        # 由最后匹配的分组判断命中了哪个分支，并按位置取分组，不再逐个按名字查找
+        if match.lastgroup == 'vol_title':
+            return VOLUME, match[1], match[2]
+        return CHAPTER, match[3], match[4]
+    
+    def scan_buffer(self, buf, index: Optional[LineIndex] = None) -> List[StructItem]:
+        """
+        扫描 UTF-8 字节缓冲区（bytes 或 mmap），返回所有标题行
+        
+        由字节正则在 C 层一次性找出所有候选行，只有候选行才解码成字符串再做精确匹配；
+        行号由换行符索引二分查找得到
+        """
+        headers = []
+        append = headers.append
+        match_line = self.match
+        
+        first = _CANDIDATE_FIRST_LINE.match(buf)
+        candidates = [(0, first.end())] if first else []
+        candidates.extend(candidate.span(1) for candidate in _CANDIDATE_LINE.finditer(buf))
+        
+        index = index or LineIndex(buf)
+        line_numbers = index.line_numbers([start for start, _ in candidates])
+        
+        for line_num, (start, end) in zip(line_numbers, candidates):
+            result = match_line(buf[start:end].decode('utf-8').strip())
+            if result:
+                kind, number_str, title = result
+                append(StructItem(kind, line_num, number_str, title, start, end))
+        return headers
+
+
+# 中文数字与位权
+_NUMBER_DIGITS = {
+    '零': 0, '一': 1, '二': 2, '三': 3, '四': 4,
+    '五': 5, '六': 6, '七': 7, '八': 8, '九': 9,
+    **{str(d): d for d in range(10)}
+}
+_NUMBER_UNITS = {'十': 10, '百': 100, '千': 1000, '万': 10000}
+
+
+# 章节预览的字符数
+PREVIEW_LENGTH = 100
+
+
+# 模块级共享的默认扫描器
+DEFAULT_SCANNER = ChapterScanner()
+
+
+# HTML 可视化中不含变量的固定部分，模块加载时构建一次
+_HTML_HEAD = """
+<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>小说章节结构可视化</title>
+    <style>
+        body { font-family: 'Microsoft YaHei', Arial, sans-serif; margin: 20px; background: #f5f5f5; }
+        .container { max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+        .header { text-align: center; margin-bottom: 30px; }
+        .header h1 { color: #2c3e50; margin-bottom: 10px; }
+        .stats { display: flex; justify-content: space-around; margin: 20px 0; }
+        .stat { text-align: center; background: #ecf0f1; padding: 15px; border-radius: 8px; }
+        .stat-number { font-size: 24px; font-weight: bold; color: #3498db; }
+        .stat-label { color: #7f8c8d; margin-top: 5px; }
+        .volume { margin: 20px 0; border: 2px solid #3498db; border-radius: 10px; overflow: hidden; }
+        .volume-header { background: #3498db; color: white; padding: 15px; }
+        .volume-title { font-size: 18px; font-weight: bold; }
+        .volume-info { font-size: 14px; opacity: 0.9; margin-top: 5px; }
+        .chapter { border-bottom: 1px solid #ecf0f1; padding: 15px; background: white; }
+        .chapter:last-child { border-bottom: none; }
+        .chapter-title { font-weight: bold; color: #2c3e50; margin-bottom: 8px; }
+        .chapter-info { color: #7f8c8d; font-size: 12px; }
+        .chapter-preview { color: #34495e; margin-top: 8px; font-style: italic; }
+        .progress-bar { background: #ecf0f1; height: 6px; border-radius: 3px; margin: 5px 0; }
+        .progress-fill { background: #27ae60; height: 100%; border-radius: 3px; }
+    </style>
+"""
+
+# 页头模板，只需填入源文件名和三项统计数字
+_HTML_HEADER_TEMPLATE = """</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>📚 小说章节结构可视化</h1>
+            <p>源文件: {source_file}</p>
+        </div>
+        
+        <div class="stats">
+            <div class="stat">
+                <div class="stat-number">{total_volumes}</div>
+                <div class="stat-label">总卷数</div>
+            </div>
+            <div class="stat">
+                <div class="stat-number">{total_chapters}</div>
+                <div class="stat-label">总章数</div>
+            </div>
+            <div class="stat">
+                <div class="stat-number">{total_words:,}</div>
+                <div class="stat-label">总字数</div>
+            </div>
+        </div>
+"""
+
+_HTML_FOOTER = """
+    </div>
+</body>
+</html>
+"""
+
 class ChapterStructureVisualizer:
-    def __init__(self, config_path: Optional[str] = None):
+    def __init__(self, config_path: Optional[str] = None, scanner: Optional[ChapterScanner] = None):
         self.chapters = []
         self.volumes = []
-        self.patterns = {
-            'volume': [
-                r'^第([一二三四五六七八九十百千万\d]+)卷\s+(.+)$',
-                r'^第(\d+)卷\s+(.+)$'
-            ],
-            'chapter': [
-                r'^第([一二三四五六七八九十百千万\d]+)章\s+(.+)$', 
-                r'^第(\d+)章\s+(.+)$'
-            ]
-        }
+        self.scanner = scanner or DEFAULT_SCANNER
         
     def parse_file(self, file_path: str) -> Dict:
-        """解析文件并生成章节结构"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        """
+        解析文件并生成章节结构
         
-        # 预处理文本
-        cleaned_lines = []
-        for i, line in enumerate(lines):
-            cleaned_line = line.strip()
-            if cleaned_line:
-                cleaned_lines.append((i + 1, cleaned_line))
+        文件以内存映射方式读取，标题定位在原始字节上完成，只有章节正文和标题行会被解码。
+        按 \\n 划分行，输入应为编码转换步骤输出的 UTF-8 文本
+        """
+        with open(file_path, 'rb') as f:
+            # 空文件无法映射
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        try:
+            return self.parse_buffer(buf, file_path)
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+    
+    def parse_buffer(self, buf, source_file: str, index: Optional[LineIndex] = None) -> Dict:
+        """
+        解析已读入内存（或已映射）的文件字节并生成章节结构
+        
+        调用方已经持有文件字节和换行符索引时直接传入，避免重复读取文件和重建索引
+        """
+        # 换行符位置索引只构建一次，供行号查询和定位章节正文共用
+        if index is None:
+            index = LineIndex(buf)
         
         # 识别章节标题
-        structure_items = self._identify_structure(cleaned_lines)
+        volume_items, chapter_items = self._identify_structure(buf, index)
         
         # 构建层级结构
-        volumes = self._build_hierarchy(structure_items, cleaned_lines)
+        volumes = self._build_hierarchy(volume_items, chapter_items, buf, index,
+                                        self._count_nonblank_lines(buf, index))
         
         return {
             'metadata': {
-                'source_file': file_path,
+                'source_file': source_file,
                 'total_volumes': len(volumes),
                 'total_chapters': sum(len(vol.chapters) for vol in volumes),
                 'total_words': sum(vol.total_words for vol in volumes)
             },
-            'volumes': [asdict(vol) for vol in volumes]
+            'volumes': volumes
         }
     
-    def _identify_structure(self, lines: List[Tuple[int, str]]) -> List[Dict]:
-        """识别卷和章节标题"""
-        structure_items = []
-        
-        for line_num, line_content in lines:
-            # 检查卷标题
-            for pattern in self.patterns['volume']:
-                match = re.match(pattern, line_content)
-                if match:
-                    number_str, title = match.groups()
-                    structure_items.append({
-                        'type': 'volume',
-                        'line_number': line_num,
-                        'number_str': number_str,
-                        'title': title,
-                        'raw_text': line_content
-                    })
-                    break
-            else:
-                # 检查章节标题
-                for pattern in self.patterns['chapter']:
-                    match = re.match(pattern, line_content)
-                    if match:
-                        number_str, title = match.groups()
-                        structure_items.append({
-                            'type': 'chapter',
-                            'line_number': line_num,
-                            'number_str': number_str,
-                            'title': title,
-                            'raw_text': line_content
-                        })
-                        break
-        
-        return structure_items
+    def _identify_structure(self, buf, index: Optional[LineIndex] = None) -> Tuple[List[StructItem], List[StructItem]]:
+        """识别卷和章节标题，分别返回卷标题列表和章标题列表"""
+        volume_items, chapter_items = [], []
+        for item in self.scanner.scan_buffer(buf, index):
+            (volume_items if item.kind == VOLUME else chapter_items).append(item)
+        return volume_items, chapter_items
     
-    def _build_hierarchy(self, structure_items: List[Dict], all_lines: List[Tuple[int, str]]) -> List[Volume]:
-        """构建层级结构"""
-        volumes = []
-        current_volume = None
-        chapters = []
-        
-        for i, item in enumerate(structure_items):
-            if item['type'] == 'volume':
-                # 保存之前的卷
-                if current_volume:
-                    current_volume.chapters = chapters
-                    current_volume.end_line = chapters[-1].end_line if chapters else current_volume.start_line
-                    current_volume.total_words = sum(ch.word_count for ch in chapters)
-                    volumes.append(current_volume)
-                
-                # 创建新卷
-                current_volume = Volume(
-                    title=item['title'],
-                    number=self._parse_number(item['number_str']),
-                    chapters=[],
-                    start_line=item['line_number'],
-                    end_line=0,
-                    total_words=0
-                )
-                chapters = []
-                
-            elif item['type'] == 'chapter':
-                # 确定章节结束位置
-                next_item_line = structure_items[i + 1]['line_number'] if i + 1 < len(structure_items) else len(all_lines)
-                
-                # 提取章节内容
-                content_info = self._extract_chapter_content(all_lines, item['line_number'], next_item_line - 1)
-                
-                chapter = Chapter(
-                    volume_title=current_volume.title if current_volume else "未知卷",
-                    volume_number=current_volume.number if current_volume else 0,
-                    chapter_title=item['title'],
-                    chapter_number=self._parse_number(item['number_str']),
-                    start_line=item['line_number'],
-                    end_line=next_item_line - 1,
-                    word_count=content_info['word_count'],
-                    content_preview=content_info['preview']
-                )
-                chapters.append(chapter)
-        
-        # 处理最后一个卷
-        if current_volume:
-            current_volume.chapters = chapters
-            current_volume.end_line = chapters[-1].end_line if chapters else current_volume.start_line
-            current_volume.total_words = sum(ch.word_count for ch in chapters)
-            volumes.append(current_volume)
+    @staticmethod
+    def _count_nonblank_lines(buf, index: LineIndex) -> int:
+        """统计非空行数（去掉首尾空白后不为空的行）"""
+        if not buf:
+            return 0
+        total = index.total_lines
+        blank = sum(1 for _ in _BLANK_LINE.finditer(buf))
+        if _BLANK_FIRST_LINE.match(buf):
+            blank += 1
+        # 文件以换行符结尾时，末尾还会多匹配一个并不存在的空行
+        if buf[-1:] == b'\n':
+            blank -= 1
+        return total - blank
+    
+    def _build_hierarchy(self, volume_items: List[StructItem], chapter_items: List[StructItem], buf,
+                         index: LineIndex, line_count: int) -> List[Volume]:
+        """
+        构建层级结构
+        
+        Args:
+            volume_items: 卷标题行列表
+            chapter_items: 章标题行列表
+            buf: 原始文件字节
+            index: 换行符位置索引
+            line_count: 非空行数，最后一章的结束行号由其确定
+        """
+        volumes = [
+            Volume(
+                title=item.title,
+                number=self._parse_number(item.number_str),
+                chapters=[],
+                start_line=item.line_number,
+                end_line=0,
+                total_words=0
+            )
+            for item in volume_items
+        ]
+        volume_lines = [item.line_number for item in volume_items]
+        
+        for i, item in enumerate(chapter_items):
+            # 章节所属的卷：行号不大于章标题的最后一个卷；第一个卷之前的章节不属于任何卷，不输出
+            vol_index = bisect_right(volume_lines, item.line_number) - 1
+            if vol_index < 0:
+                continue
+            volume = volumes[vol_index]
+            
+            # 章节在下一个标题（下一章或下一卷，取较早者）之前结束
+            next_item = chapter_items[i + 1] if i + 1 < len(chapter_items) else None
+            if vol_index + 1 < len(volume_items):
+                next_volume = volume_items[vol_index + 1]
+                if next_item is None or next_volume.line_number < next_item.line_number:
+                    next_item = next_volume
+            
+            # 确定章节结束位置，正文为标题行之后到结束行为止的字节
+            if next_item is not None:
+                next_item_line = next_item.line_number
+                content_end = next_item.start_offset
+            else:
+                next_item_line = line_count
+                end_line = next_item_line - 1
+                content_end = index.line_end(end_line) if end_line > item.line_number else item.end_offset
+            
+            # 提取章节内容
+            content_info = self._extract_chapter_content(buf[item.end_offset:content_end].decode('utf-8'))
+            
+            volume.chapters.append(Chapter(
+                volume_title=volume.title,
+                volume_number=volume.number,
+                chapter_title=item.title,
+                chapter_number=self._parse_number(item.number_str),
+                start_line=item.line_number,
+                end_line=next_item_line - 1,
+                word_count=content_info['word_count'],
+                content_preview=content_info['preview']
+            ))
+        
+        for volume in volumes:
+            chapters = volume.chapters
+            volume.end_line = chapters[-1].end_line if chapters else volume.start_line
+            volume.total_words = sum(ch.word_count for ch in chapters)
         
         return volumes
     
-    def _extract_chapter_content(self, lines: List[Tuple[int, str]], start_line: int, end_line: int) -> Dict:
-        """提取章节内容"""
-        content_lines = []
-        word_count = 0
-        
-        for line_num, line_content in lines:
-            if start_line < line_num <= end_line:
-                content_lines.append(line_content)
-                word_count += len(line_content.replace(' ', '').replace('\t', ''))
+    def _extract_chapter_content(self, content: str) -> Dict:
+        """提取章节内容（去掉首尾空白后的非空行）"""
+        content_lines = [line for line in map(str.strip, content.split('\n')) if line]
+        # 整章拼接后按计数扣除空格和制表符，不再逐行生成中间字符串
+        # （str.translate 对中文文本逐字符查表，反而比 count 慢两个数量级）
+        chapter_text = ''.join(content_lines)
+        word_count = len(chapter_text) - chapter_text.count(' ') - chapter_text.count('\t')
         
-        content_text = '\n'.join(content_lines)
-        preview = content_text[:100] + '...' if len(content_text) > 100 else content_text
+        # 预览只需要前100个字符：只拼接凑够长度的前几行，不再把整章用 \n 拼接一遍
+        preview_lines = []
+        preview_len = -1
+        for line in content_lines:
+            if preview_len >= PREVIEW_LENGTH:
+                break
+            preview_lines.append(line)
+            preview_len += len(line) + 1
+        preview = '\n'.join(preview_lines)[:PREVIEW_LENGTH]
+        # 按行拼接后的全文长度 = 字符数 + 换行符数
+        if len(chapter_text) + len(content_lines) - 1 > PREVIEW_LENGTH:
+            preview += '...'
         
         return {
             'word_count': word_count,
@@ -183,105 +428,37 @@ class ChapterStructureVisualizer:
             'line_count': len(content_lines)
         }
     
-    def _parse_number(self, number_str: str) -> int:
-        """解析中文数字或阿拉伯数字"""
-        # 基础中文数字映射
-        chinese_digits = {
-            '一': 1, '二': 2, '三': 3, '四': 4, '五': 5,
-            '六': 6, '七': 7, '八': 8, '九': 9, '零': 0
-        }
-        
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _parse_number(number_str: str) -> int:
+        """解析中文数字或阿拉伯数字，无法解析时返回1（编号取值有限，结果缓存复用）"""
         # 如果是阿拉伯数字
         if number_str.isdigit():
             return int(number_str)
         
-        # 处理中文数字
         if not number_str:
             return 1
         
-        # 处理简单的一位数字
-        if len(number_str) == 1 and number_str in chinese_digits:
-            return chinese_digits[number_str]
-        
-        result = 0
-        
-        # 处理百位数
-        if '百' in number_str:
-            if number_str == '百':
-                return 100
-            
-            # 分割百位和其余部分
-            parts = number_str.split('百')
-            if len(parts) == 2:
-                # 获取百位数字
-                hundred_part = parts[0] if parts[0] else '一'  # 如果没有前缀，默认是"一"
-                hundreds = chinese_digits.get(hundred_part, 1) * 100
-                
-                # 处理百位后的部分
-                remainder = parts[1]
-                if remainder:
-                    if remainder == '零':
-                        # 一百零X的情况，比如一百零一
-                        pass
-                    elif '零' in remainder:
-                        # 处理"一百零一"这样的情况
-                        if remainder.startswith('零'):
-                            remainder = remainder[1:]  # 去掉"零"
-                            result = hundreds + chinese_digits.get(remainder, 0)
-                        else:
-                            result = hundreds
-                    elif '十' in remainder:
-                        # 处理"一百一十"、"一百二十三"这样的情况
-                        if remainder == '十':
-                            result = hundreds + 10
-                        elif remainder.startswith('十'):
-                            # 一百十一、一百十二...一百十九
-                            tens_remainder = remainder[1:]
-                            result = hundreds + 10 + chinese_digits.get(tens_remainder, 0)
-                        elif remainder.endswith('十'):
-                            # 一百二十、一百三十...一百九十
-                            tens_prefix = remainder[:-1]
-                            result = hundreds + chinese_digits.get(tens_prefix, 1) * 10
-                        else:
-                            # 一百二十一、一百二十二...一百九十九
-                            tens_parts = remainder.split('十')
-                            if len(tens_parts) == 2:
-                                tens = chinese_digits.get(tens_parts[0], 0) * 10
-                                ones = chinese_digits.get(tens_parts[1], 0)
-                                result = hundreds + tens + ones
-                            else:
-                                result = hundreds
-                    else:
-                        # 一百一、一百二...一百九
-                        result = hundreds + chinese_digits.get(remainder, 0)
-                else:
-                    # 只有百位，如"三百"
-                    result = hundreds
-                
-                return result
-        
-        # 处理包含"十"的数字（非百位数）
-        if '十' in number_str:
-            if number_str == '十':
-                return 10
-            elif number_str.startswith('十'):
-                # 十一、十二...十九
-                remainder = number_str[1:]
-                return 10 + chinese_digits.get(remainder, 0)
-            elif number_str.endswith('十'):
-                # 二十、三十...九十
-                prefix = number_str[:-1]
-                return chinese_digits.get(prefix, 1) * 10
+        # 从左到右单遍归约：数字暂存在 current，遇到十/百/千乘上位权累加到 section，
+        # 遇到万把 section 整体乘 10000 累加到 result；省略的系数（如"十二"的"十"）按1处理
+        result, section, current = 0, 0, 0
+        for char in number_str:
+            digit = _NUMBER_DIGITS.get(char)
+            if digit is not None:
+                # 连续数字按位拼接，兼容"一零八"这类逐位写法
+                current = current * 10 + digit
+                continue
+            unit = _NUMBER_UNITS.get(char)
+            if unit is None:
+                return 1
+            if unit == 10000:
+                result += ((section + current) or 1) * unit
+                section = 0
             else:
-                # 二十一、二十二...九十九
-                parts = number_str.split('十')
-                if len(parts) == 2:
-                    tens = chinese_digits.get(parts[0], 0) * 10
-                    ones = chinese_digits.get(parts[1], 0)
-                    return tens + ones
-        
-        # 如果无法解析，返回1作为默认值
-        return 1
+                section += (current or 1) * unit
+            current = 0
+        
+        return result + section + current
     
     def generate_text_visualization(self, structure_data: Dict) -> str:
         """生成文本格式的可视化"""
@@ -300,17 +477,17 @@ class ChapterStructureVisualizer:
         output.append("")
         
         for vol_data in structure_data['volumes']:
-            output.append(f"📂 第{vol_data['number']}卷: {vol_data['title']}")
-            output.append(f"   └─ 行号: {vol_data['start_line']}-{vol_data['end_line']}")
-            output.append(f"   └─ 章节数: {len(vol_data['chapters'])}")
-            output.append(f"   └─ 字数: {vol_data['total_words']:,}")
+            output.append(f"📂 第{vol_data.number}卷: {vol_data.title}")
+            output.append(f"   └─ 行号: {vol_data.start_line}-{vol_data.end_line}")
+            output.append(f"   └─ 章节数: {len(vol_data.chapters)}")
+            output.append(f"   └─ 字数: {vol_data.total_words:,}")
             output.append("")
             
-            for chapter in vol_data['chapters']:
-                output.append(f"   📄 第{chapter['chapter_number']}章: {chapter['chapter_title']}")
-                output.append(f"      ├─ 行号: {chapter['start_line']}-{chapter['end_line']}")
-                output.append(f"      ├─ 字数: {chapter['word_count']:,}")
-                output.append(f"      └─ 预览: {chapter['content_preview']}")
+            for chapter in vol_data.chapters:
+                output.append(f"   📄 第{chapter.chapter_number}章: {chapter.chapter_title}")
+                output.append(f"      ├─ 行号: {chapter.start_line}-{chapter.end_line}")
+                output.append(f"      ├─ 字数: {chapter.word_count:,}")
+                output.append(f"      └─ 预览: {chapter.content_preview}")
                 output.append("")
         
         output.append("=" * 80)
@@ -323,20 +500,23 @@ class ChapterStructureVisualizer:
         output.append("└─ " + Path(structure_data['metadata']['source_file']).name)
         
         volumes = structure_data['volumes']
+        last_vol_index = len(volumes) - 1
         for i, vol_data in enumerate(volumes):
-            is_last_vol = i == len(volumes) - 1
+            is_last_vol = i == last_vol_index
             vol_prefix = "   └─ " if is_last_vol else "   ├─ "
-            output.append(f"{vol_prefix}第{vol_data['number']}卷: {vol_data['title']} ({vol_data['total_words']:,}字)")
+            output.append(f"{vol_prefix}第{vol_data.number}卷: {vol_data.title} ({vol_data.total_words:,}字)")
+            
+            # 章节前缀只取决于是否为最后一卷/最后一章，在循环外选好
+            if is_last_vol:
+                middle_prefix, last_prefix = "      ├─ ", "      └─ "
+            else:
+                middle_prefix, last_prefix = "   │  ├─ ", "   │  └─ "
             
-            chapters = vol_data['chapters']
+            chapters = vol_data.chapters
+            last_chapter_index = len(chapters) - 1
             for j, chapter in enumerate(chapters):
-                is_last_chapter = j == len(chapters) - 1
-                if is_last_vol:
-                    chapter_prefix = "      └─ " if is_last_chapter else "      ├─ "
-                else:
-                    chapter_prefix = "   │  └─ " if is_last_chapter else "   │  ├─ "
-                
-                output.append(f"{chapter_prefix}第{chapter['chapter_number']}章: {chapter['chapter_title']} ({chapter['word_count']:,}字)")
+                chapter_prefix = last_prefix if j == last_chapter_index else middle_prefix
+                output.append(f"{chapter_prefix}第{chapter.chapter_number}章: {chapter.chapter_title} ({chapter.word_count:,}字)")
         
         return '\n'.join(output)
     
@@ -344,99 +524,93 @@ class ChapterStructureVisualizer:
         """生成HTML格式的可视化"""
         metadata = structure_data['metadata']
         
-        html = f"""
-<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>小说章节结构可视化</title>
-    <style>
-        body {{ font-family: 'Microsoft YaHei', Arial, sans-serif; margin: 20px; background: #f5f5f5; }}
-        .container {{ max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-        .header {{ text-align: center; margin-bottom: 30px; }}
-        .header h1 {{ color: #2c3e50; margin-bottom: 10px; }}
-        .stats {{ display: flex; justify-content: space-around; margin: 20px 0; }}
-        .stat {{ text-align: center; background: #ecf0f1; padding: 15px; border-radius: 8px; }}
-        .stat-number {{ font-size: 24px; font-weight: bold; color: #3498db; }}
-        .stat-label {{ color: #7f8c8d; margin-top: 5px; }}
-        .volume {{ margin: 20px 0; border: 2px solid #3498db; border-radius: 10px; overflow: hidden; }}
-        .volume-header {{ background: #3498db; color: white; padding: 15px; }}
-        .volume-title {{ font-size: 18px; font-weight: bold; }}
-        .volume-info {{ font-size: 14px; opacity: 0.9; margin-top: 5px; }}
-        .chapter {{ border-bottom: 1px solid #ecf0f1; padding: 15px; background: white; }}
-        .chapter:last-child {{ border-bottom: none; }}
-        .chapter-title {{ font-weight: bold; color: #2c3e50; margin-bottom: 8px; }}
-        .chapter-info {{ color: #7f8c8d; font-size: 12px; }}
-        .chapter-preview {{ color: #34495e; margin-top: 8px; font-style: italic; }}
-        .progress-bar {{ background: #ecf0f1; height: 6px; border-radius: 3px; margin: 5px 0; }}
-        .progress-fill {{ background: #27ae60; height: 100%; border-radius: 3px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📚 小说章节结构可视化</h1>
-            <p>源文件: {metadata['source_file']}</p>
-        </div>
-        
-        <div class="stats">
-            <div class="stat">
-                <div class="stat-number">{metadata['total_volumes']}</div>
-                <div class="stat-label">总卷数</div>
-            </div>
-            <div class="stat">
-                <div class="stat-number">{metadata['total_chapters']}</div>
-                <div class="stat-label">总章数</div>
-            </div>
-            <div class="stat">
-                <div class="stat-number">{metadata['total_words']:,}</div>
-                <div class="stat-label">总字数</div>
-            </div>
-        </div>
-"""
+        # 片段先收集到列表，最后一次性拼接，避免大字符串反复 += 带来的二次方拷贝
+        parts = [_HTML_HEAD, _HTML_HEADER_TEMPLATE.format(
+            source_file=metadata['source_file'],
+            total_volumes=metadata['total_volumes'],
+            total_chapters=metadata['total_chapters'],
+            total_words=metadata['total_words']
+        )]
         
+        # 百分比换算系数每卷只算一次，循环内用乘法代替除法和分支
         total_words = metadata['total_words']
+        inv_total = 100.0 / total_words if total_words > 0 else 0.0
         for vol_data in structure_data['volumes']:
-            vol_percentage = (vol_data['total_words'] / total_words * 100) if total_words > 0 else 0
+            vw = vol_data.total_words
+            chapters = vol_data.chapters
+            vol_percentage = vw * inv_total
+            inv_vw = 100.0 / vw if vw > 0 else 0.0
             
-            html += f"""
+            parts.append(f"""
         <div class="volume">
             <div class="volume-header">
-                <div class="volume-title">第{vol_data['number']}卷: {vol_data['title']}</div>
+                <div class="volume-title">第{vol_data.number}卷: {vol_data.title}</div>
                 <div class="volume-info">
-                    章节数: {len(vol_data['chapters'])} | 字数: {vol_data['total_words']:,} | 占比: {vol_percentage:.1f}%
+                    章节数: {len(chapters)} | 字数: {vw:,} | 占比: {vol_percentage:.1f}%
                 </div>
                 <div class="progress-bar">
                     <div class="progress-fill" style="width: {vol_percentage}%"></div>
                 </div>
             </div>
-"""
+""")
             
-            for chapter in vol_data['chapters']:
-                chapter_percentage = (chapter['word_count'] / vol_data['total_words'] * 100) if vol_data['total_words'] > 0 else 0
+            for chapter in chapters:
+                chapter_percentage = chapter.word_count * inv_vw
                 
-                html += f"""
+                parts.append(f"""
             <div class="chapter">
-                <div class="chapter-title">第{chapter['chapter_number']}章: {chapter['chapter_title']}</div>
+                <div class="chapter-title">第{chapter.chapter_number}章: {chapter.chapter_title}</div>
                 <div class="chapter-info">
-                    行号: {chapter['start_line']}-{chapter['end_line']} | 字数: {chapter['word_count']:,} | 占本卷: {chapter_percentage:.1f}%
+                    行号: {chapter.start_line}-{chapter.end_line} | 字数: {chapter.word_count:,} | 占本卷: {chapter_percentage:.1f}%
                 </div>
                 <div class="progress-bar">
                     <div class="progress-fill" style="width: {chapter_percentage}%"></div>
                 </div>
-                <div class="chapter-preview">{chapter['content_preview']}</div>
+                <div class="chapter-preview">{chapter.content_preview}</div>
             </div>
-"""
+""")
             
-            html += "        </div>\n"
+            parts.append("        </div>\n")
         
-        html += """
-    </div>
-</body>
-</html>
-"""
-        return html
+        parts.append(_HTML_FOOTER)
+        return ''.join(parts)
+
+
+def process_file(input_file: str, output_dir: Optional[str] = None, scanner: Optional[ChapterScanner] = None) -> bool:
+    """
+    解析小说章节结构，并在输出目录生成 HTML 和 JSON 两种可视化结果
+    
+    Args:
+        input_file: 输入的小说文件路径
+        output_dir: 输出目录，默认为 output/
+        scanner: 预先构建的标题扫描器，批量处理多个文件时可复用
+        
+    Returns:
+        bool: 处理是否成功
+    """
+    try:
+        output_dir = Path(output_dir) if output_dir else OUTPUT_DIR
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        visualizer = ChapterStructureVisualizer(scanner=scanner)
+        structure_data = visualizer.parse_file(input_file)
+        
+        html_file = output_dir / "chapter_structure.html"
+        with open(html_file, 'w', encoding='utf-8') as f:
+            f.write(visualizer.generate_html_visualization(structure_data))
+        
+        json_file = output_dir / "chapter_structure.json"
+        with open(json_file, 'wb') as f:
+            f.write(_dumps_bytes(structure_data))
+        
+        metadata = structure_data['metadata']
+        log_info(f"共识别 {metadata['total_volumes']} 卷，{metadata['total_chapters']} 章")
+        log_info(f"可视化结果已保存到: {html_file}, {json_file}")
+        return True
+        
+    except Exception as e:
+        log_error(f"章节结构处理失败 {input_file}: {e}")
+        return False
 
 
 def main():
@@ -470,7 +644,13 @@ def main():
     elif args.format == 'html':
         output_content = visualizer.generate_html_visualization(structure_data)
     elif args.format == 'json':
-        output_content = json.dumps(structure_data, ensure_ascii=False, indent=2)
+        # 写文件时直接写出序列化得到的字节，省去解码再编码
+        if args.output:
+            with open(args.output, 'wb') as f:
+                f.write(_dumps_bytes(structure_data))
+            log_info(f"可视化结果已保存到: {args.output}")
+            return 0
+        output_content = _dumps(structure_data)
     
     # 输出结果
     if args.output:
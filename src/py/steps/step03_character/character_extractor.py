@@ -8,29 +8,253 @@
 import json
 import re
 import os
+import time
+import hashlib
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional, Set
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Tuple, Optional, Set, Union
+from dataclasses import dataclass, is_dataclass
 from datetime import datetime
-from functools import lru_cache
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_right
+
+# 可选：Aho-Corasick 多模式匹配，一次扫描统计所有人名，未安装时逐个人名 str.count
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# 可选：orjson 序列化结果（原生支持 dataclass，速度远高于标准库 json），未安装时使用 json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 
 # 导入项目常量
 from utils.constants import PROJECT_ROOT, OUTPUT_DIR
+from utils.config_util import load_config_section
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 批量处理文件时同时发往模型服务的请求数
+MODEL_CONCURRENCY = 4
+
+# 长文本切分后，相邻片段之间重叠的字符数
+CHUNK_OVERLAP = 150
+
+# 模型服务连接池大小，不小于并发请求数
+HTTP_POOL_SIZE = 16
+# 连接失败或模型服务暂时不可用（502/503/504）时的重试次数与退避系数
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+# 请求体已预先序列化为 JSON 字节时需要显式声明类型
+JSON_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+# 同时发往模型服务的请求总数上限（批量处理与长文本切分的并发叠加后也不超过此值）
+MAX_INFLIGHT_REQUESTS = 8
+# 模型服务请求失败后，该服务地址暂停分配请求的时间（秒）
+ENDPOINT_COOLDOWN = 30
+# 服务地址响应耗时指数移动平均的平滑系数
+LATENCY_EWMA_ALPHA = 0.2
+# 预热连接请求的超时时间（秒）
+WARMUP_TIMEOUT = 5
+
+# 模型响应缓存目录与有效期
+RESPONSE_CACHE_DIR = OUTPUT_DIR / ".llm_cache"
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
+# 提示词模板版本，修改提示词后递增，使旧的缓存响应失效
+PROMPT_VERSION = 1
+
+# 对话类型
+DIALOGUE_TYPES = ("说", "想")
+# 人物与对话提取结果的 JSON Schema，随请求发给模型服务，支持约束解码的服务据此限制输出
+CHARACTER_EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "characters": {"type": "array", "items": {"type": "string"}},
+        "dialogues": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "type": {"type": "string", "enum": list(DIALOGUE_TYPES)},
+                    "dialog_content": {"type": "string"}
+                },
+                "required": ["name", "type", "dialog_content"]
+            }
+        }
+    },
+    "required": ["characters", "dialogues"]
+}
+
+# 人物与对话提取提示词，待分析文本插在前缀与后缀之间
+EXTRACTION_PROMPT_PREFIX = """
+请仔细分析以下中文小说文本，提取其中的人物名称和所有对话内容。
+
+要求：
+1. 识别文本中出现的所有人物名称
+2. 提取所有对话内容，包括：
+   - 直接说话的内容（用引号包围的）
+   - 心理活动/想法的内容
+3. 为每个对话标注说话人
+4. 区分是"说"还是"想"
+
+请按照以下JSON格式输出：
+{
+    "characters": ["人物1", "人物2", "人物3"],
+    "dialogues": [
+        {
+            "name": "说话人",
+            "type": "说",
+            "dialog_content": "说话内容"
+        },
+        {
+            "name": "说话人",
+            "type": "想",
+            "dialog_content": "心理活动内容"
+        }
+    ]
+}
+
+文本内容：
+"""
+EXTRACTION_PROMPT_SUFFIX = '\n'
+
+# 提示词模板摘要，参与响应缓存键，模板修改后旧的缓存响应自动失效
+_PROMPT_TEMPLATE_DIGEST = hashlib.sha256(
+    (EXTRACTION_PROMPT_PREFIX + "\0" + EXTRACTION_PROMPT_SUFFIX).encode('utf-8')
+).hexdigest().encode('ascii')
+
+# 首次出场记录中保留的所在行字符数
+FIRST_APPEARANCE_CONTEXT_LENGTH = 100
+
+
+# 模型输出列表行首的序号或项目符号，如 "1. "、"2、"、"- "、"• "
+_LIST_PREFIX = re.compile(r'^\d+[.、]?\s*|^[•·*-]\s*')
+# 汉字名称，音译名和少数民族名可用间隔号分隔，如"哈利·波特"
+_CJK_NAME = re.compile(r'[\u4e00-\u9fff]+(?:·[\u4e00-\u9fff]+)*')
+# 列表项首尾需要去除的标点
+_ITEM_STRIP_CHARS = '.,;:：，。；、"“”\'‘’ '
+
+
+def _json_default(obj):
+    """json.dumps 的 default 回调：dataclass 直接按字段取值，避免 asdict 递归深拷贝"""
+    if is_dataclass(obj) and not isinstance(obj, type):
+        slots = getattr(type(obj), '__slots__', None)
+        if slots is not None:
+            return {name: getattr(obj, name) for name in slots}
+        return obj.__dict__
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_result(obj, pretty: bool = True) -> bytes:
+    """把提取结果序列化为 UTF-8 JSON 字节
+    
+    默认输出缩进 2 格的 JSON，pretty 为 False 时输出紧凑格式（只供程序读取的文件无需缩进）
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, default=_json_default, option=option)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=_json_default).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+
+def _dumps_payload(payload) -> bytes:
+    """把请求体序列化为紧凑的 UTF-8 JSON 字节"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def read_text(file_path) -> str:
+    """读取 UTF-8 文本文件，整个文件一次读入并一次解码
+    
+    跳过文本模式逐块解码和换行转换的开销；换行符与文本模式读取一样统一为 \n
+    """
+    text = Path(file_path).read_bytes().decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _decode_first_object(text: str) -> Optional[Dict]:
+    """解析文本中第一个完整的 JSON 对象
+    
+    从每个 '{' 处用 raw_decode 尝试解析，解析在对象结束处停止，不必先 rfind 定位结尾，
+    也不受对象后面的说明文字影响；模型在 JSON 前输出了带花括号的文字时继续尝试下一个 '{'
+    
+    Returns:
+        解析出的对象，文本中没有 '{' 时返回None
+    
+    Raises:
+        json.JSONDecodeError: 所有 '{' 处都无法解析出 JSON 对象
+    """
+    error = None
+    start = text.find('{')
+    while start != -1:
+        try:
+            data, _ = _JSON_DECODER.raw_decode(text, start)
+            return data
+        except json.JSONDecodeError as e:
+            error = error or e
+        start = text.find('{', start + 1)
+    if error is not None:
+        raise error
+    return None
+
+
+class TokenBucket:
+    """线程安全的令牌桶限速器，平均每秒放行 rate 个请求，允许不超过 capacity 个的突发"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """取得一个令牌，令牌不足时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
 @dataclass
+class ModelEndpoint:
+    """模型服务地址及其负载状态"""
+    api_base: str
+    inflight: int = 0  # 正在处理的请求数
+    latency: float = 0.0  # 响应耗时的指数移动平均（秒）
+    unhealthy_until: float = 0.0  # 请求失败后暂停分配的截止时间
+
+@dataclass(slots=True)
 class Character:
     """人物信息数据结构"""
     name: str
 
-@dataclass
+@dataclass(slots=True)
 class DialogueEntry:
-    """对话条目数据结构"""
+    """对话条目数据结构（使用 __slots__，大量对话时每个实例不再携带 __dict__）"""
     dialog_id: str
     name: str
     type: str  # "说" or "想"
@@ -46,44 +270,252 @@ class CharacterExtractionResult:
 class QwenCharacterExtractor:
     """基于QWEN3模型的人物名称提取器"""
     
-    def __init__(self, model_service_url: str = "http://localhost:19100"):
+    # 模型常把代词、称谓或提示词中的字段名当作人名输出
+    _INVALID_WORDS = frozenset({
+        "无", "他", "她", "它", "我", "你", "您", "他们", "她们", "我们", "你们",
+        "众人", "有人", "此人", "那人", "这人", "某人", "自己", "大家",
+        "人物", "名称", "姓名", "人名", "答案", "最终答案", "思考过程",
+    })
+    # 常见单字姓与复姓；超过 _PLAIN_NAME_MAX_LENGTH 个字的名称须以其中之一开头
+    _SINGLE_SURNAMES = frozenset(
+        "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜"
+        "戚谢邹喻柏水窦章云苏潘葛奚范彭郎鲁韦昌马苗凤花方俞任袁柳鲍史唐"
+        "费廉岑薛雷贺倪汤滕殷罗毕郝邬安常乐于时傅皮卞齐康伍余元顾孟平黄"
+        "和穆萧尹姚邵汪祁毛禹狄米贝明臧计伏成戴谈宋茅庞熊纪舒屈项祝董梁"
+        "杜阮蓝闵席季麻强贾路娄危江童颜郭梅盛林刁钟徐邱骆高夏蔡田樊胡凌"
+        "霍虞万支柯管卢莫房解应宗丁宣邓郁单杭洪包左石崔吉龚程邢裴陆荣翁"
+        "荀甄曲封储靳焦牧山谷车侯全班仰秋仲伊宫宁仇栾甘厉戎祖武符刘景詹"
+        "龙叶幸司黎白蒲邰从鄂索咸赖卓蔺屠蒙池乔阴胥苍闻党翟谭贡姬申冉雍"
+        "桑桂牛寿通边燕冀浦尚温庄晏柴瞿阎慕连习艾鱼容向古易廖终居衡步耿"
+        "满弘匡国文寇广禄欧沃利蔚越隆师聂晁勾敖融冷辛阚简饶曾沙鞠丰巢关"
+        "相查荆红游竺权盖益桓公"
+    )
+    _COMPOUND_SURNAMES = frozenset({
+        "欧阳", "司马", "上官", "诸葛", "东方", "皇甫", "尉迟", "公孙", "慕容",
+        "长孙", "宇文", "司徒", "司空", "独孤", "南宫", "西门", "令狐", "夏侯",
+        "轩辕", "端木", "百里", "呼延", "东郭", "澹台", "公冶", "太史", "申屠",
+        "钟离", "闻人", "赫连", "拓跋", "完颜", "万俟", "宗政", "濮阳", "淳于",
+    })
+    # 不超过此长度的纯汉字名称（如"老五"、"小翠"这类称呼）不要求以姓氏开头
+    _PLAIN_NAME_MAX_LENGTH = 4
+    
+    def __init__(self, model_service_url: Union[str, List[str]] = "http://localhost:19100", cache: Optional[bool] = None,
+                 rate_limit_rps: Optional[float] = None, concurrency_limit: int = MAX_INFLIGHT_REQUESTS):
         """初始化提取器
         
         Args:
-            model_service_url: 模型服务地址
+            model_service_url: 模型服务地址，部署了多个模型服务时传入地址列表，
+                每个请求发往当前负载最低的服务，请求失败时改发其他服务
+            cache: 是否使用磁盘响应缓存，相同提示词重复处理时直接返回缓存的响应；
+                为None时取 config.json 中的 extraction.response_cache，默认不使用
+            rate_limit_rps: 每秒最多发出的请求数，为None时不限速
+            concurrency_limit: 同时进行中的请求数上限
         """
-        self.model_service_url = model_service_url.rstrip('/')
+        urls = [model_service_url] if isinstance(model_service_url, str) else list(model_service_url)
+        if not urls:
+            raise ValueError("至少需要一个模型服务地址")
+        self.model_service_url = urls[0].rstrip('/')
         self.api_base = f"{self.model_service_url}/api/v1"
+        self.endpoints = [ModelEndpoint(f"{url.rstrip('/')}/api/v1") for url in urls]
+        self._endpoint_lock = threading.Lock()
+        extraction_config = load_config_section("extraction")
+        self.cache_enabled = extraction_config.get("response_cache", False) if cache is None else cache
+        # 模型标识参与缓存键，更换模型后不会命中旧模型的响应
+        self.model_id = load_config_section("model").get("name", "")
+        
+        # 平滑发往模型服务的请求，避免并发突增使服务端排队过长或拒绝请求
+        self._rate_limiter = TokenBucket(rate_limit_rps) if rate_limit_rps else None
+        self._request_slots = threading.BoundedSemaphore(concurrency_limit)
+        
+        # 复用同一个会话的 keep-alive 连接，不再为每次请求重新建立 TCP 连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE,
+            pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=Retry(
+                total=HTTP_RETRIES,
+                connect=HTTP_RETRIES,
+                status=HTTP_RETRIES,
+                # /chat 不是幂等请求，读超时说明服务端可能仍在生成，不再重发同一请求
+                read=0,
+                backoff_factor=HTTP_BACKOFF_FACTOR,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=frozenset({"POST"})
+            )
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # 后台预先建立到模型服务的连接，首个真实请求不必再等待握手
+        self._warmup_lock = threading.Lock()
+        threading.Thread(target=self._warmup, daemon=True).start()
         
-    def _call_model_service(self, message: str) -> Optional[str]:
-        """调用模型服务
+        self._min_name_length = extraction_config.get("min_name_length", 2)
+        self._max_name_length = extraction_config.get("max_name_length", 10)
+        # 单次发给模型的文本长度上限，超过时切分为多个片段
+        self._chunk_size = extraction_config.get("text_chunk_size", 2000)
+        # is_valid_name 的结果按名称缓存；缓存随实例释放，不会像 lru_cache 那样持有 self
+        self._valid_name_cache: Dict[str, bool] = {}
+        output_config = load_config_section("output")
+        # 结果文件是否缩进输出，结果只供后续步骤读取时可关闭以加快序列化、减小文件
+        self._pretty_output = output_config.get("pretty_json", True)
+        # 结果文件中是否附带人物出场统计
+        self._include_statistics = output_config.get("include_statistics", True)
+        
+    def _warmup(self):
+        """向模型服务发送一个轻量请求，让连接池中留下一条已建立的连接；失败不影响后续调用"""
+        # 已有预热在进行时直接返回
+        if not self._warmup_lock.acquire(blocking=False):
+            return
+        try:
+            for endpoint in self.endpoints:
+                try:
+                    self.session.get(f"{endpoint.api_base}/health", timeout=WARMUP_TIMEOUT)
+                except requests.exceptions.RequestException as e:
+                    logger.debug(f"模型服务连接预热失败 {endpoint.api_base}: {e}")
+        finally:
+            self._warmup_lock.release()
+    
+    def _acquire_endpoint(self, tried: Set[str]) -> Optional[ModelEndpoint]:
+        """选择本次请求使用的服务地址：优先可用的，其中正在处理的请求最少、平均耗时最短的
+        
+        Args:
+            tried: 本次调用已经失败过的服务地址
+            
+        Returns:
+            选中的服务地址，所有地址都已尝试过时返回None
+        """
+        now = time.monotonic()
+        with self._endpoint_lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.api_base not in tried]
+            if not candidates:
+                return None
+            # 全部处于暂停期时仍然尝试，不让请求直接失败
+            healthy = [endpoint for endpoint in candidates if endpoint.unhealthy_until <= now]
+            endpoint = min(healthy or candidates, key=lambda e: (e.inflight, e.latency))
+            endpoint.inflight += 1
+            return endpoint
+    
+    def _release_endpoint(self, endpoint: ModelEndpoint, elapsed: float, success: bool):
+        """请求结束后更新服务地址的负载状态"""
+        with self._endpoint_lock:
+            endpoint.inflight -= 1
+            if success:
+                endpoint.latency = (elapsed if endpoint.latency == 0.0
+                                    else LATENCY_EWMA_ALPHA * elapsed + (1 - LATENCY_EWMA_ALPHA) * endpoint.latency)
+                endpoint.unhealthy_until = 0.0
+            else:
+                endpoint.unhealthy_until = time.monotonic() + ENDPOINT_COOLDOWN
+    
+    def close(self):
+        """关闭与模型服务的连接"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _cache_path(self, message: str, json_schema: Optional[Dict] = None) -> Path:
+        """响应缓存文件路径，以模型服务地址、模型标识、提示词模板、输出 Schema 和消息内容的 SHA-256 命名"""
+        key = hashlib.sha256(b"\n".join((
+            f"{self.api_base}\n{self.model_id}\n{PROMPT_VERSION}".encode('utf-8'),
+            _PROMPT_TEMPLATE_DIGEST,
+            _dumps_payload(json_schema),
+            message.encode('utf-8'),
+        ))).hexdigest()
+        return RESPONSE_CACHE_DIR / f"{key}.txt"
+    
+    def _read_cached_response(self, message: str, json_schema: Optional[Dict] = None) -> Optional[str]:
+        """读取未过期的缓存响应，未命中时返回None"""
+        cache_path = self._cache_path(message, json_schema)
+        try:
+            if time.time() - cache_path.stat().st_mtime > RESPONSE_CACHE_TTL:
+                return None
+            return cache_path.read_text(encoding='utf-8')
+        except OSError:
+            return None
+    
+    def _write_cached_response(self, message: str, response: str, json_schema: Optional[Dict] = None):
+        """保存响应到缓存，先写临时文件再替换，避免并发读到写了一半的文件"""
+        cache_path = self._cache_path(message, json_schema)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            RESPONSE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(response, encoding='utf-8')
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"写入响应缓存失败: {e}")
+    
+    def _call_model_service(self, message: str, json_schema: Optional[Dict] = None) -> Optional[str]:
+        """调用模型服务，启用缓存时相同消息直接返回缓存的响应
         
         Args:
             message: 要发送的消息
+            json_schema: 期望输出满足的 JSON Schema，模型服务支持约束解码时据此限制输出
             
         Returns:
             模型响应文本，如果失败返回None
         """
+        if self.cache_enabled:
+            cached = self._read_cached_response(message, json_schema)
+            if cached is not None:
+                logger.info("命中响应缓存，跳过模型服务调用")
+                return cached
+        
+        payload = {
+            "message": message,
+            "history": []
+        }
+        if json_schema is not None:
+            payload["json_schema"] = json_schema
+        # 请求体和响应都用 orjson 处理（未安装时退回标准库 json）
+        body = _dumps_payload(payload)
+        
+        with self._request_slots:
+            return self._post_to_endpoints(message, body, json_schema)
+    
+    def _post_to_endpoints(self, message: str, body: bytes, json_schema: Optional[Dict] = None) -> Optional[str]:
+        """把请求发往模型服务，网络错误或服务端错误时换一个服务地址重试，每个地址最多尝试一次"""
+        tried = set()
+        for _ in self.endpoints:
+            # 先取得令牌再选择服务地址，限速等待期间不占用服务地址的进行中计数，不影响负载均衡
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+            endpoint = self._acquire_endpoint(tried)
+            if endpoint is None:
+                break
+            tried.add(endpoint.api_base)
+            start = time.monotonic()
+            success = False
+            try:
+                response = self.session.post(f"{endpoint.api_base}/chat", data=body,
+                                             headers=JSON_HEADERS, timeout=300)
+                response.raise_for_status()
+                success = True
+            except requests.exceptions.RequestException as e:
+                logger.error(f"调用模型服务时发生网络错误 {endpoint.api_base}: {e}")
+            finally:
+                self._release_endpoint(endpoint, time.monotonic() - start, success)
+            if success:
+                return self._parse_service_response(message, response, json_schema)
+        
+        return None
+    
+    def _parse_service_response(self, message: str, response, json_schema: Optional[Dict] = None) -> Optional[str]:
+        """解析模型服务的响应，成功时写入缓存并返回响应文本"""
         try:
-            url = f"{self.api_base}/chat"
-            payload = {
-                "message": message,
-                "history": []
-            }
-            
-            response = requests.post(url, json=payload, timeout=300)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = orjson.loads(response.content) if ORJSON_AVAILABLE else response.json()
             if result.get("success"):
-                return result.get("response", "")
+                response_text = result.get("response", "")
+                if self.cache_enabled and response_text:
+                    self._write_cached_response(message, response_text, json_schema)
+                return response_text
             else:
                 logger.error(f"模型服务调用失败: {result.get('error', '未知错误')}")
                 return None
                 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"调用模型服务时发生网络错误: {e}")
-            return None
         except Exception as e:
             logger.error(f"调用模型服务时发生错误: {e}")
             return None
@@ -91,74 +523,122 @@ class QwenCharacterExtractor:
     def _extract_characters_and_dialogues(self, text: str) -> Tuple[List[str], List[DialogueEntry]]:
         """从文本中提取人物和对话
         
+        超过 text_chunk_size 的长文本按段落切分为多个片段，并发调用模型后合并结果：
+        人物取并集（保持首次出现顺序），对话按片段顺序拼接并重新编号
+        
         Args:
             text: 要分析的文本
             
         Returns:
             (人物列表, 对话列表)
         """
+        chunks = self._split_text(text, self._chunk_size, CHUNK_OVERLAP)
+        if len(chunks) == 1:
+            results = [self._extract_from_chunk(chunks[0][1])]
+        else:
+            logger.info(f"文本较长，切分为 {len(chunks)} 个片段并发提取")
+            with ThreadPoolExecutor(max_workers=min(MODEL_CONCURRENCY, len(chunks))) as executor:
+                results = list(executor.map(
+                    lambda chunk: self._extract_from_chunk(f"{chunk[0]}\n{chunk[1]}" if chunk[0] else chunk[1]),
+                    chunks
+                ))
+        
+        characters = list(dict.fromkeys(
+            name for chunk_characters, _ in results for name in chunk_characters if isinstance(name, str)
+        ))
+        
+        dialogues = []
+        for (overlap_text, body), (_, chunk_dialogues) in zip(chunks, results):
+            for entry in chunk_dialogues:
+                # 跳过格式不对的条目，一个片段的异常输出不影响整个文件
+                if len(entry) != 3 or not isinstance(entry[2], str):
+                    continue
+                name, dialog_type, dialog_content = entry
+                # 只出现在重叠部分、不在本片段正文中的对话已经由上一个片段提取过；
+                # 正文中也有相同内容（如不同人物都说"好。"）时保留
+                if (overlap_text and dialog_content
+                        and dialog_content in overlap_text and dialog_content not in body):
+                    continue
+                dialogues.append(DialogueEntry(
+                    dialog_id=f"{len(dialogues) + 1:010d}",  # 10位数字序号
+                    name=name,
+                    type=dialog_type,
+                    dialog_content=dialog_content
+                ))
+        
+        return characters, dialogues
+    
+    @staticmethod
+    def _split_text(text: str, max_chars: int, overlap: int) -> List[Tuple[str, str]]:
+        """按段落把文本切分为不超过 max_chars 个字符的片段
+        
+        单个段落超过 max_chars 时按长度硬切分。除第一个片段外，每个片段附带上一个片段
+        末尾不超过 overlap 个字符的内容作为上下文，避免切分处的人物和对话缺少前文
+        
+        Returns:
+            [(重叠的上文, 片段正文)]
+        """
+        if len(text) <= max_chars:
+            return [("", text)]
+        
+        bodies = []
+        current = []
+        current_length = 0
+        for paragraph in text.split('\n'):
+            while len(paragraph) > max_chars:
+                head, paragraph = paragraph[:max_chars], paragraph[max_chars:]
+                if current:
+                    bodies.append('\n'.join(current))
+                    current, current_length = [], 0
+                bodies.append(head)
+            if current and current_length + len(paragraph) + 1 > max_chars:
+                bodies.append('\n'.join(current))
+                current, current_length = [], 0
+            current.append(paragraph)
+            current_length += len(paragraph) + 1
+        if current:
+            bodies.append('\n'.join(current))
+        
+        chunks = [("", bodies[0])]
+        for previous, body in zip(bodies, bodies[1:]):
+            # 上文从段落开头截取，只有最后一段本身超过 overlap 时才截取其末尾
+            tail = previous[-overlap:]
+            newline = tail.find('\n')
+            chunks.append((tail[newline + 1:] if newline != -1 else tail, body))
+        return chunks
+    
+    def _extract_from_chunk(self, text: str) -> Tuple[List, List[Tuple[str, str, str]]]:
+        """调用模型从单个文本片段中提取人物和对话
+        
+        Returns:
+            (人物列表, [(说话人, 类型, 对话内容)])，失败时返回两个空列表
+        """
         # 构建提示词
-        prompt = f"""
-请仔细分析以下中文小说文本，提取其中的人物名称和所有对话内容。
-
-要求：
-1. 识别文本中出现的所有人物名称
-2. 提取所有对话内容，包括：
-   - 直接说话的内容（用引号包围的）
-   - 心理活动/想法的内容
-3. 为每个对话标注说话人
-4. 区分是"说"还是"想"
-
-请按照以下JSON格式输出：
-{{
-    "characters": ["人物1", "人物2", "人物3"],
-    "dialogues": [
-        {{
-            "name": "说话人",
-            "type": "说",
-            "dialog_content": "说话内容"
-        }},
-        {{
-            "name": "说话人",
-            "type": "想",
-            "dialog_content": "心理活动内容"
-        }}
-    ]
-}}
-
-文本内容：
-{text}
-"""
+        prompt = "".join((EXTRACTION_PROMPT_PREFIX, text, EXTRACTION_PROMPT_SUFFIX))
         
         # 调用模型服务
-        response = self._call_model_service(prompt)
+        response = self._call_model_service(prompt, json_schema=CHARACTER_EXTRACTION_SCHEMA)
         if not response:
             return [], []
             
-        # 解析响应
+        # 解析响应（模型服务不支持约束解码时输出可能夹带说明文字）
         try:
             # 尝试从响应中提取JSON
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            
-            if json_start != -1 and json_end != -1:
-                json_str = response[json_start:json_end]
-                data = json.loads(json_str)
-                
+            data = _decode_first_object(response)
+            if data is not None:
                 characters = data.get("characters", [])
-                dialogues_data = data.get("dialogues", [])
-                
-                # 转换为DialogueEntry对象
                 dialogues = []
-                for i, dialogue in enumerate(dialogues_data):
-                    dialog_id = f"{i+1:010d}"  # 10位数字序号
-                    dialogues.append(DialogueEntry(
-                        dialog_id=dialog_id,
-                        name=dialogue.get("name", "未知"),
-                        type=dialogue.get("type", "说"),
-                        dialog_content=dialogue.get("dialog_content", "")
+                for dialogue in data.get("dialogues", []):
+                    # 跳过格式不对的条目（不是对象，或对话内容不是字符串），不影响同一片段的其他对话
+                    if not isinstance(dialogue, dict) or not isinstance(dialogue.get("dialog_content", ""), str):
+                        continue
+                    dialog_type = dialogue.get("type", "说")
+                    dialogues.append((
+                        dialogue.get("name", "未知"),
+                        # 不在约定范围内的类型按"说"处理
+                        dialog_type if dialog_type in DIALOGUE_TYPES else "说",
+                        dialogue.get("dialog_content", "")
                     ))
-                
                 return characters, dialogues
                 
         except json.JSONDecodeError as e:
@@ -169,6 +649,124 @@ class QwenCharacterExtractor:
             
         return [], []
     
+    @staticmethod
+    def _parse_list_items(response: str) -> List[str]:
+        """把模型输出的列表解析为去重后的条目，去除行首序号和首尾标点"""
+        items = []
+        for line in response.splitlines():
+            item = _LIST_PREFIX.sub('', line.strip()).strip(_ITEM_STRIP_CHARS)
+            if item:
+                items.append(item)
+        return list(dict.fromkeys(items))
+    
+    def parse_name_list(self, response: str) -> List[str]:
+        """解析模型返回的人名列表（每行一个人名）
+        
+        Args:
+            response: 模型响应文本
+            
+        Returns:
+            人名列表
+        """
+        return self._parse_list_items(response)
+    
+    def is_valid_name(self, name: str) -> bool:
+        """判断模型提取的名称是否可能是人名
+        
+        Args:
+            name: 名称
+            
+        Returns:
+            长度在配置范围内的汉字名称（可含间隔号），且不是代词、称谓等无效词，
+            较长时以常见姓氏开头或为带间隔号的音译名，返回True
+        """
+        result = self._valid_name_cache.get(name)
+        if result is None:
+            result = self._check_name(name)
+            self._valid_name_cache[name] = result
+        return result
+    
+    def _check_name(self, name: str) -> bool:
+        """is_valid_name 的实际判断逻辑"""
+        if not (self._min_name_length <= len(name) <= self._max_name_length):
+            return False
+        if name in self._INVALID_WORDS or not _CJK_NAME.fullmatch(name):
+            return False
+        return (len(name) <= self._PLAIN_NAME_MAX_LENGTH
+                or '·' in name
+                or name[0] in self._SINGLE_SURNAMES
+                or name[:2] in self._COMPOUND_SURNAMES)
+    
+    @staticmethod
+    def _scan_names(text: str, names: List[str]) -> Dict[str, Tuple[int, int]]:
+        """统计每个人名在文本中的出现次数和首次出现位置
+        
+        安装了 pyahocorasick 时构建自动机，一次扫描同时匹配所有人名，
+        复杂度 O(文本长度 + 匹配数)，而逐个 str.count 为 O(人名数 × 文本长度)；
+        同一人名的重叠匹配不重复计数（"哈哈哈"中"哈哈"计 1 次），与 str.count 结果一致
+        
+        Args:
+            text: 文本
+            names: 人名列表
+            
+        Returns:
+            {人名: (出现次数, 首次出现的字符偏移)}，未出现时偏移为 -1
+        """
+        names = [name for name in dict.fromkeys(names) if name]
+        if not AHOCORASICK_AVAILABLE:
+            return {name: (text.count(name), text.find(name)) for name in names}
+        
+        if not names:
+            return {}
+        automaton = ahocorasick.Automaton()
+        for name in names:
+            automaton.add_word(name, name)
+        automaton.make_automaton()
+        
+        counts = Counter()
+        first_offsets = {}
+        match_ends = {}
+        for end, name in automaton.iter(text):
+            start = end - len(name) + 1
+            if start <= match_ends.get(name, -1):
+                continue
+            counts[name] += 1
+            match_ends[name] = end
+            if name not in first_offsets:
+                first_offsets[name] = start
+        return {name: (counts[name], first_offsets.get(name, -1)) for name in names}
+    
+    def calculate_character_statistics(self, text: str, names: List[str]) -> Dict[str, Dict]:
+        """计算人物出场统计
+        
+        Args:
+            text: 文本
+            names: 人名列表
+            
+        Returns:
+            {人名: {"total_appearances": 出现次数,
+                    "first_appearance": {"line": 首次出现的行号, "context": 所在行内容}}}
+            未出现的人名 first_appearance 为 None
+        """
+        scan_result = self._scan_names(text, names)
+        
+        # 行首偏移表只建一次，首次出现位置通过二分查找换算为行号
+        line_starts = [0]
+        line_starts.extend(match.end() for match in re.finditer('\n', text))
+        
+        statistics = {}
+        for name, (count, first_offset) in scan_result.items():
+            first_appearance = None
+            if first_offset >= 0:
+                line = bisect_right(line_starts, first_offset)
+                line_end = line_starts[line] if line < len(line_starts) else len(text)
+                first_appearance = {
+                    "line": line,
+                    "context": text[line_starts[line - 1]:line_end].strip()[:FIRST_APPEARANCE_CONTEXT_LENGTH]
+                }
+            statistics[name] = {"total_appearances": count, "first_appearance": first_appearance}
+        return statistics
+    
     def process_file(self, input_file: str, output_file: Optional[str] = None) -> bool:
         """处理单个文件
         
@@ -186,8 +784,7 @@ class QwenCharacterExtractor:
                 logger.error(f"输入文件不存在: {input_file}")
                 return False
                 
-            with open(input_path, 'r', encoding='utf-8') as f:
-                text = f.read()
+            text = read_text(input_path)
                 
             logger.info(f"开始处理文件: {input_file}")
             
@@ -220,12 +817,17 @@ class QwenCharacterExtractor:
                     "dialogue_count": len(dialogues)
                 },
                 "characters": characters,
-                "dialogues": [asdict(dialogue) for dialogue in dialogues]
+                # DialogueEntry 由序列化函数直接处理，不再逐条 asdict 深拷贝
+                "dialogues": dialogues
             }
+            if self._include_statistics:
+                result_data["statistics"] = self.calculate_character_statistics(
+                    text, [name for name in characters if isinstance(name, str)]
+                )
             
             # 写入输出文件
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(result_data, f, ensure_ascii=False, indent=2)
+            with open(output_path, 'wb') as f:
+                f.write(dumps_result(result_data, pretty=self._pretty_output))
                 
             logger.info(f"结果已保存到: {output_path}")
             return True
@@ -234,6 +836,87 @@ class QwenCharacterExtractor:
             logger.error(f"处理文件时发生错误: {e}")
             return False
     
+    @staticmethod
+    def _load_checkpoint(checkpoint_file: Optional[str]) -> Set[str]:
+        """读取断点文件中已完成的输入文件路径，文件不存在时返回空集合"""
+        if not checkpoint_file or not os.path.exists(checkpoint_file):
+            return set()
+        
+        completed = set()
+        line = "\n"
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    completed.add(json.loads(line)["source_file"])
+                except (ValueError, KeyError, TypeError):
+                    # 进程中断时最后一行可能只写了一半
+                    continue
+        
+        # 补上被截断的最后一行的换行符，之后追加的记录从新的一行开始
+        if not line.endswith("\n"):
+            with open(checkpoint_file, 'a', encoding='utf-8') as f:
+                f.write("\n")
+        return completed
+    
+    def process_files(self, input_files: List[str], output_dir: Optional[str] = None,
+                      max_workers: int = MODEL_CONCURRENCY,
+                      checkpoint_file: Optional[str] = None) -> Dict[str, bool]:
+        """并发处理多个文件
+        
+        耗时几乎都在等待模型服务响应，用线程池同时发出最多 max_workers 个请求，
+        总耗时由 N × 单文件耗时降为约 N / max_workers × 单文件耗时。
+        指定断点文件时，每处理成功一个文件立即追加一行记录并落盘，
+        重新运行时跳过已记录的文件，中断后可以从断点继续
+        
+        Args:
+            input_files: 输入文件路径列表
+            output_dir: 输出目录，为None时使用默认输出目录
+            max_workers: 最大并发请求数
+            checkpoint_file: JSONL 断点文件路径，为None时不记录断点
+            
+        Returns:
+            {输入文件路径: 是否成功}，断点中已完成的文件视为成功
+        """
+        completed = self._load_checkpoint(checkpoint_file)
+        results = {input_file: True for input_file in input_files if str(input_file) in completed}
+        pending = [input_file for input_file in input_files if str(input_file) not in completed]
+        if results:
+            logger.info(f"断点文件中已完成 {len(results)} 个文件，跳过")
+        if not pending:
+            return results
+        
+        checkpoint_lock = threading.Lock()
+        
+        # 输出文件按输入文件名命名；不同目录下的同名文件（如各卷的"第1章.txt"）加上所在目录名区分
+        output_root = Path(output_dir) if output_dir else Path(OUTPUT_DIR)
+        stem_counts = Counter(Path(input_file).stem for input_file in input_files)
+        
+        def output_path_for(input_file):
+            input_path = Path(input_file)
+            if stem_counts[input_path.stem] > 1:
+                return output_root / f"characters_{input_path.parent.name}_{input_path.stem}.json"
+            return output_root / f"characters_{input_path.stem}.json"
+        
+        def process(input_file):
+            success = self.process_file(input_file, str(output_path_for(input_file)))
+            if success and checkpoint_file:
+                record = json.dumps({
+                    "source_file": str(input_file),
+                    "completed_time": datetime.now().isoformat()
+                }, ensure_ascii=False)
+                # 多个工作线程共用一个断点文件，追加写入需要串行
+                with checkpoint_lock, open(checkpoint_file, 'a', encoding='utf-8') as f:
+                    f.write(record + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            return success
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            results.update(zip(pending, executor.map(process, pending)))
+        
+        logger.info(f"批量处理完成: {sum(results.values())}/{len(results)} 个文件成功")
+        return results
+    
     def process_chapter_file(self, chapter_file: str) -> bool:
         """处理指定的章节文件
         
@@ -266,11 +949,9 @@ def main():
     input_file = sys.argv[1]
     output_file = sys.argv[2] if len(sys.argv) > 2 else None
     
-    # 创建提取器
-    extractor = QwenCharacterExtractor()
-    
-    # 处理文件
-    success = extractor.process_file(input_file, output_file)
+    # 创建提取器并处理文件
+    with QwenCharacterExtractor() as extractor:
+        success = extractor.process_file(input_file, output_file)
     
     if success:
         print("✅ 人物和对话提取完成")
@@ -1,53 +1,99 @@
-import torch
-from modelscope import AutoModelForCausalLM, AutoTokenizer
-from transformers import TextIteratorStreamer
+# torch / modelscope / transformers 体积很大，推迟到真正使用模型时再导入，
+# 仅导入本模块不会拉起 PyTorch 和 CUDA 运行时
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import count
+from importlib.util import find_spec
+
+from utils.config_util import load_config_section
 from utils.log_util import default_logger as logger
 
-try:
-    import pynvml
-    PYNVML_AVAILABLE = True
-except ImportError:
-    PYNVML_AVAILABLE = False
-    logger.warning("pynvml 不可用，将使用简单的 GPU 选择策略")
+# 单次生成的最大 token 数
+MAX_NEW_TOKENS = 32768
+# 渲染对话历史前缀时追加的占位用户消息
+_HISTORY_PROBE = "<<history-probe>>"
+
+def load_model_config():
+    """读取项目配置文件中的 model 配置"""
+    return load_config_section("model")
+
 
+@lru_cache(maxsize=1)
 def get_best_gpu():
-    """选择可用内存最多的 GPU 设备"""
+    """选择可用内存最多的 GPU 设备，结果在进程内缓存"""
+    import torch
+    
     if not torch.cuda.is_available():
         return None
     
-    best_gpu = 0
-    max_free_memory = 0
+    try:
+        import pynvml
+        pynvml_available = True
+    except ImportError:
+        pynvml_available = False
+        logger.warning("pynvml 不可用，将使用简单的 GPU 选择策略")
     
-    if PYNVML_AVAILABLE:
+    if pynvml_available:
         try:
+            # 结果已缓存，NVML 只在这一次查询期间打开，查询完立即关闭
             pynvml.nvmlInit()
-            for i in range(torch.cuda.device_count()):
-                handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-                meminfo = pynvml.nvmlDeviceGetMemoryInfo(handle)
-                
-                total_memory = meminfo.total
-                used_memory = meminfo.used
-                free_memory = meminfo.free
-                
-                logger.info(f"GPU {i}: 总内存 {total_memory / 1024**3:.2f} GB, 已用 {used_memory / 1024**3:.2f} GB, 可用 {free_memory / 1024**3:.2f} GB")
-                
-                if free_memory > max_free_memory:
-                    max_free_memory = free_memory
-                    best_gpu = i
+            try:
+                # NVML 按物理编号枚举全部 GPU，torch 的设备编号受 CUDA_VISIBLE_DEVICES 和
+                # CUDA_DEVICE_ORDER 影响，两者按 UUID 对应，找不到对应设备时抛出异常走回退策略
+                handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+                handles_by_uuid = {}
+                for handle in handles:
+                    uuid = pynvml.nvmlDeviceGetUUID(handle)
+                    if isinstance(uuid, bytes):
+                        uuid = uuid.decode()
+                    handles_by_uuid[uuid.removeprefix("GPU-")] = handle
+                device_count = torch.cuda.device_count()
+                meminfos = [
+                    pynvml.nvmlDeviceGetMemoryInfo(handles_by_uuid[str(torch.cuda.get_device_properties(i).uuid)])
+                    for i in range(device_count)
+                ]
+            finally:
+                try:
+                    pynvml.nvmlShutdown()
+                except Exception:
+                    pass
+            
+            for i, meminfo in enumerate(meminfos):
+                logger.info(f"GPU {i}: 总内存 {meminfo.total / 1024**3:.2f} GB, 已用 {meminfo.used / 1024**3:.2f} GB, 可用 {meminfo.free / 1024**3:.2f} GB")
             
-            logger.info(f"选择 GPU {best_gpu} (可用内存: {max_free_memory / 1024**3:.2f} GB)")
+            best_gpu = max(range(device_count), key=lambda i: meminfos[i].free)
+            logger.info(f"选择 GPU {best_gpu} (可用内存: {meminfos[best_gpu].free / 1024**3:.2f} GB)")
             return best_gpu
             
         except Exception as e:
             logger.error(f"使用 pynvml 检测 GPU 时出错: {e}")
             # 回退到简单策略
     
-    # 简单策略：使用固定 GPU 3
-    logger.info("使用简单的 GPU 选择策略，固定选择 GPU 3")
-    return 3
+    # 简单策略：使用 config.json 中的 gpu.device_id，该编号在本机不存在时使用当前设备
+    device_id = load_config_section("gpu").get("device_id", 0)
+    if not isinstance(device_id, int) or not 0 <= device_id < torch.cuda.device_count():
+        device_id = torch.cuda.current_device()
+    logger.info(f"使用简单的 GPU 选择策略，选择 GPU {device_id}")
+    return device_id
 
 class QwenChatbot:
-    def __init__(self, model_name="Qwen/Qwen3-8B"):
+    def __init__(self, model_name="Qwen/Qwen3-8B", use_vllm=False, quantization=None, compile_model=None):
+        """
+        Args:
+            model_name: 模型名称
+            use_vllm: 有 GPU 且安装了 vLLM 时使用 vLLM 推理（分页 KV 缓存 + 连续批处理），
+                否则使用 transformers 的 generate
+            quantization: 权重量化方式，"none" / "int8" / "nf4"，仅在 GPU 上生效，
+                需要安装 bitsandbytes；为 None 时取 config.json 中的 model.quantization
+            compile_model: 在 GPU 上用 torch.compile 编译模型前向，减少逐 token 解码时的
+                Python 调度开销，首次编译耗时较长；为 None 时取 config.json 中的 model.compile
+        """
+        import torch
+        from modelscope import AutoModelForCausalLM, AutoTokenizer
+        
         model_kwargs = {
             "trust_remote_code": True,
         }
@@ -55,74 +101,381 @@ class QwenChatbot:
         # 自动选择内存最多的 GPU
         best_gpu = get_best_gpu()
         if best_gpu is not None:
+            # 锁页内存和异步拷贝都作用在当前设备上
+            torch.cuda.set_device(best_gpu)
+            # 允许 float32 矩阵乘使用 TF32 张量核心（Ampere 及以上）
+            torch.backends.cuda.matmul.allow_tf32 = True
+            # Ampere 及以上 GPU 使用 bfloat16，避免 float16 在 softmax 中溢出；
+            # 注意力优先使用 FlashAttention-2，未安装时退回 PyTorch SDPA 融合内核
             model_kwargs.update(
                 {
-                    "torch_dtype": torch.float16,
+                    "torch_dtype": torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16,
+                    "attn_implementation": "flash_attention_2" if find_spec("flash_attn") else "sdpa",
                     "device_map": {"": best_gpu},
                 }
             )
+            quantization_config = self._build_quantization_config(quantization, model_kwargs["torch_dtype"])
+            if quantization_config is not None:
+                model_kwargs["quantization_config"] = quantization_config
         else:
             logger.warning("未检测到 CUDA 设备，使用 CPU")
             model_kwargs.update({"torch_dtype": torch.float32})        
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name,trust_remote_code=True)
-        self.model = AutoModelForCausalLM.from_pretrained(model_name,**model_kwargs)
+        # 每个线程持有独立的 tokenizer，并发请求之间不争用同一实例的内部锁
+        self.model_name = model_name
+        self._thread_local = threading.local()
+        self._thread_local.tokenizer = self._load_tokenizer()
+        
+        self.engine = None
+        self.model = None
+        if use_vllm and best_gpu is not None and find_spec("vllm"):
+            from vllm import LLM
+            logger.info("使用 vLLM 推理引擎")
+            # 开启自动前缀缓存：共享同一前缀的请求复用已计算的 KV 块
+            self.engine = LLM(model=model_name, dtype="auto", max_model_len=MAX_NEW_TOKENS, trust_remote_code=True,
+                              enable_prefix_caching=True)
+            self._request_counter = count()
+            # LLMEngine 不是线程安全的：所有请求的提交和 step() 都由同一个常驻线程执行，
+            # 输出按 request_id 分发到各请求自己的队列
+            self._vllm_pending = queue.SimpleQueue()
+            threading.Thread(target=self._drive_vllm_engine, daemon=True, name="qwen-vllm").start()
+        else:
+            if use_vllm:
+                logger.warning("vLLM 不可用，使用 transformers 推理")
+            self.model = AutoModelForCausalLM.from_pretrained(model_name,**model_kwargs)
+            # 只做推理：关闭 dropout 等训练期行为；逐 token 解码复用 KV 缓存
+            self.model.eval()
+            self.model.generation_config.use_cache = True
+            if compile_model is None:
+                compile_model = load_model_config().get("compile", False)
+            if compile_model and best_gpu is not None:
+                self._compile_model()
+            # 模型加载后设备固定，缓存下来避免每次请求都查询
+            self._device = self.model.device
         self.history = []
+        # 流式生成在常驻的工作线程中执行，连续调用不再每次创建新线程
+        self._stream_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qwen-stream")
+        # 对话历史按模板渲染后的文本及其 token id，新一轮只需对新增部分分词
+        self._history_prefix = ("", [])
+        
+        # 相同对话内容的模板渲染和分词结果按实例缓存
+        self._pin_memory = torch.cuda.is_available()
+        self._encode_messages = lru_cache(maxsize=128)(self._encode_messages_uncached)
 
-    def generate_response(self, user_input):
-        messages = self.history + [{"role": "user", "content": user_input}]
+    @property
+    def tokenizer(self):
+        """当前线程的 tokenizer，首次在新线程中使用时加载"""
+        tokenizer = getattr(self._thread_local, "tokenizer", None)
+        if tokenizer is None:
+            tokenizer = self._load_tokenizer()
+            self._thread_local.tokenizer = tokenizer
+        return tokenizer
+
+    def _load_tokenizer(self):
+        """加载 tokenizer；批量生成时在左侧填充，使各条提示词的末尾对齐到生成起点"""
+        from modelscope import AutoTokenizer
+        
+        # 明确使用 Rust 实现的 fast tokenizer，避免个别权重目录退回到纯 Python 实现
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True, use_fast=True)
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        return tokenizer
+
+    def _generate(self, **kwargs):
+        """在 inference_mode 下调用 model.generate，省去自动求导的版本计数等记录
+        
+        inference_mode 按线程生效，流式生成在其他线程中执行时同样经由此方法
+        """
+        import torch
+        
+        with torch.inference_mode():
+            return self.model.generate(**kwargs)
+
+    def _compile_model(self):
+        """编译模型前向（CUDA Graph），并预热一次，避免首个请求承担编译耗时"""
+        import torch
+        
+        if not hasattr(torch, "compile"):
+            logger.warning("当前 PyTorch 不支持 torch.compile，跳过模型编译")
+            return
+        
+        logger.info("编译模型前向...")
+        self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=False)
+        
+        warmup_inputs = self.tokenizer("你好", return_tensors="pt").to(self.model.device)
+        self._generate(**warmup_inputs, max_new_tokens=4, use_cache=True)
+        logger.info("模型编译预热完成")
 
-        text = self.tokenizer.apply_chat_template(
+    @staticmethod
+    def _build_quantization_config(quantization, compute_dtype):
+        """构建 bitsandbytes 量化配置，不量化或不可用时返回None"""
+        if quantization is None:
+            quantization = load_model_config().get("quantization", "none")
+        if quantization == "none":
+            return None
+        
+        if not find_spec("bitsandbytes"):
+            logger.warning("bitsandbytes 不可用，不进行量化")
+            return None
+        
+        from transformers import BitsAndBytesConfig
+        
+        if quantization == "int8":
+            return BitsAndBytesConfig(load_in_8bit=True)
+        if quantization == "nf4":
+            return BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=compute_dtype,
+                # 对量化常数再做一次量化，每个参数再省约 0.4 bit 显存
+                bnb_4bit_use_double_quant=True,
+            )
+        
+        raise ValueError(f"不支持的量化方式: {quantization}")
+
+    def _render_prompt(self, messages):
+        """按对话模板渲染出模型输入文本"""
+        return self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True
         )
 
-        inputs = self.tokenizer(text, return_tensors="pt")
-        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
-        result=self.model.generate(**inputs, max_new_tokens=32768)
-        # logger.info(f"generate result:{result}")
-        response_ids = result[0][len(inputs["input_ids"][0]):].tolist()
-        response = self.tokenizer.decode(response_ids, skip_special_tokens=True)
+    def _encode_messages_uncached(self, messages_key):
+        """渲染对话模板并分词，返回 CPU 上的张量（有 CUDA 时放在锁页内存中）
+        
+        渲染结果以缓存的对话历史文本开头时，复用历史部分的 token id，只对新增部分分词
+        """
+        import torch
+        
+        messages = [{"role": role, "content": content} for role, content in messages_key]
+        text = self._render_prompt(messages)
+        
+        prefix_text, prefix_ids = self._history_prefix
+        if prefix_text and text.startswith(prefix_text):
+            input_ids = prefix_ids + self.tokenizer(text[len(prefix_text):], add_special_tokens=False)["input_ids"]
+        else:
+            input_ids = self.tokenizer(text)["input_ids"]
+        
+        input_ids = torch.tensor([input_ids])
+        inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+        if self._pin_memory:
+            return {k: v.pin_memory() for k, v in inputs.items()}
+        return inputs
 
-        # Update history
+    def _update_history(self, user_input, response):
+        """追加一轮对话，并增量更新对话历史的渲染文本和 token id"""
         self.history.append({"role": "user", "content": user_input})
         self.history.append({"role": "assistant", "content": response})
+        
+        # 对话模板可能随后续消息改写之前的轮次（如 Qwen3 会去掉早前回复中的思考内容），
+        # 因此在历史后追加一条占位用户消息再渲染，截掉占位消息本身，得到下一轮提示词的真实前缀
+        probe = [{"role": "user", "content": _HISTORY_PROBE}]
+        tokenizer = self.tokenizer
+        full_text = tokenizer.apply_chat_template(self.history + probe, tokenize=False)
+        probe_text = tokenizer.apply_chat_template(probe, tokenize=False)
+        if not full_text.endswith(probe_text):
+            self._history_prefix = ("", [])
+            return
+        text = full_text[:-len(probe_text)]
+        
+        prefix_text, prefix_ids = self._history_prefix
+        if prefix_text and text.startswith(prefix_text):
+            ids = prefix_ids + tokenizer(text[len(prefix_text):], add_special_tokens=False)["input_ids"]
+        else:
+            ids = tokenizer(text)["input_ids"]
+        self._history_prefix = (text, ids)
+
+    def _prepare_inputs(self, messages):
+        """获取对话的模型输入，并异步拷贝到模型所在设备"""
+        messages_key = tuple((m["role"], m["content"]) for m in messages)
+        inputs = self._encode_messages(messages_key)
+        return {k: v.to(self._device, non_blocking=True) for k, v in inputs.items()}
+
+    def _to_device(self, inputs):
+        """把分词结果放入锁页内存（有 CUDA 时）后异步拷贝到模型所在设备"""
+        if self._pin_memory:
+            return {k: v.pin_memory().to(self._device, non_blocking=True) for k, v in inputs.items()}
+        return {k: v.to(self._device) for k, v in inputs.items()}
+
+    def _sampling_params(self):
+        """vLLM 采样参数，沿用模型自带的生成配置"""
+        params = self.engine.get_default_sampling_params()
+        params.max_tokens = MAX_NEW_TOKENS
+        return params
+
+    def _drive_vllm_engine(self):
+        """vLLM 引擎驱动线程：接收新请求并反复 step()，把每个请求的累计输出文本放入其队列，
+        请求结束时放入 None，引擎出错时把异常交给所有进行中的请求"""
+        engine = self.engine.llm_engine
+        streams = {}
+        while True:
+            # 没有进行中的请求时阻塞等待新请求
+            pending = [self._vllm_pending.get()] if not streams else []
+            while True:
+                try:
+                    pending.append(self._vllm_pending.get_nowait())
+                except queue.Empty:
+                    break
+            for request_id, prompt, params, output_queue in pending:
+                try:
+                    engine.add_request(request_id, prompt, params)
+                    streams[request_id] = output_queue
+                except Exception as e:
+                    output_queue.put(e)
+            if not streams:
+                continue
+            
+            try:
+                outputs = engine.step()
+            except Exception as e:
+                logger.error(f"vLLM 引擎执行出错: {e}")
+                for output_queue in streams.values():
+                    output_queue.put(e)
+                streams.clear()
+                continue
+            for output in outputs:
+                output_queue = streams.get(output.request_id)
+                if output_queue is None:
+                    continue
+                output_queue.put(output.outputs[0].text)
+                if output.finished:
+                    output_queue.put(None)
+                    del streams[output.request_id]
+
+    def _submit_vllm(self, prompt, params):
+        """把请求交给引擎驱动线程，返回接收该请求输出的队列"""
+        output_queue = queue.SimpleQueue()
+        self._vllm_pending.put((str(next(self._request_counter)), prompt, params, output_queue))
+        return output_queue
+
+    @staticmethod
+    def _iter_vllm_outputs(output_queue):
+        """依次产出请求的累计输出文本，直到请求结束"""
+        while (item := output_queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _complete_vllm(self, prompts, params):
+        """提交全部提示词后等待完成，返回与 prompts 一一对应的最终文本"""
+        output_queues = [self._submit_vllm(prompt, params) for prompt in prompts]
+        results = []
+        for output_queue in output_queues:
+            text = ""
+            for text in self._iter_vllm_outputs(output_queue):
+                pass
+            results.append(text)
+        return results
+
+    def _generate_stream_vllm(self, prompt):
+        """通过 vLLM 引擎逐步生成，依次产出新增的文本片段"""
+        sent = 0
+        for text in self._iter_vllm_outputs(self._submit_vllm(prompt, self._sampling_params())):
+            if len(text) > sent:
+                yield text[sent:]
+                sent = len(text)
+
+    def generate_response(self, user_input):
+        messages = self.history + [{"role": "user", "content": user_input}]
+
+        if self.engine is not None:
+            response = self._complete_vllm([self._render_prompt(messages)], self._sampling_params())[0]
+        else:
+            inputs = self._prepare_inputs(messages)
+            result = self._generate(**inputs, max_new_tokens=MAX_NEW_TOKENS)
+            # logger.info(f"generate result:{result}")
+            response_ids = result[0][len(inputs["input_ids"][0]):].tolist()
+            response = self.tokenizer.decode(response_ids, skip_special_tokens=True)
+
+        # Update history
+        self._update_history(user_input, response)
 
         return response
 
     def generate_response_stream(self, user_input):
         """流式输出响应，可以实时看到模型的思考过程"""
+        from transformers import TextIteratorStreamer
+        
         messages = self.history + [{"role": "user", "content": user_input}]
 
-        text = self.tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
-
-        inputs = self.tokenizer(text, return_tensors="pt")
-        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+        if self.engine is not None:
+            generated_text = ""
+            for new_text in self._generate_stream_vllm(self._render_prompt(messages)):
+                generated_text += new_text
+                print(new_text, end='', flush=True)
+        else:
+            inputs = self._prepare_inputs(messages)
+            
+            # 使用流式生成
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+            generation_kwargs = dict(inputs, streamer=streamer, max_new_tokens=MAX_NEW_TOKENS)
+            
+            future = self._stream_executor.submit(self._generate, **generation_kwargs)
+            # 生成异常结束时 streamer 不会收到结束信号，由回调补上，避免下面的循环一直阻塞
+            future.add_done_callback(lambda f: f.exception() is not None and streamer.end())
+            
+            generated_text = ""
+            for new_text in streamer:
+                generated_text += new_text
+                print(new_text, end='', flush=True)
+            
+            # 生成线程中的异常在此抛出
+            future.result()
+        
+        # Update history
+        self._update_history(user_input, generated_text)
         
-        # 使用流式生成
-        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
-        generation_kwargs = dict(inputs, streamer=streamer, max_new_tokens=32768)
+        return generated_text
+
+    async def generate_response_stream_async(self, user_input):
+        """
+        异步流式输出响应，逐段产出生成的文本
         
-        import threading
-        thread = threading.Thread(target=self.model.generate, kwargs=generation_kwargs)
-        thread.start()
+        模型生成在线程池中运行，新文本经 asyncio.Queue 交回事件循环，
+        一个事件循环线程即可同时服务多路流式请求（如 FastAPI StreamingResponse）；
+        使用 vLLM 时引擎只由驱动线程执行，各路请求只在线程池中等待各自的输出队列
+        """
+        loop = asyncio.get_running_loop()
+        messages = self.history + [{"role": "user", "content": user_input}]
         
         generated_text = ""
-        for new_text in streamer:
-            generated_text += new_text
-            print(new_text, end='', flush=True)
-        
-        thread.join()
+        if self.engine is not None:
+            iterator = self._generate_stream_vllm(self._render_prompt(messages))
+            while (new_text := await loop.run_in_executor(None, next, iterator, None)) is not None:
+                generated_text += new_text
+                yield new_text
+        else:
+            queue = asyncio.Queue()
+            streamer = _make_async_queue_streamer(self.tokenizer, loop, queue)
+            inputs = self._prepare_inputs(messages)
+            future = loop.run_in_executor(
+                None, partial(self._generate, **inputs, streamer=streamer, max_new_tokens=MAX_NEW_TOKENS)
+            )
+            # 生成异常结束时 streamer 不会发出结束标记，由回调补上
+            future.add_done_callback(lambda _: queue.put_nowait(None))
+            
+            while (new_text := await queue.get()) is not None:
+                if new_text:
+                    generated_text += new_text
+                    yield new_text
+            await future
         
         # Update history
-        self.history.append({"role": "user", "content": user_input})
-        self.history.append({"role": "assistant", "content": generated_text})
-        
-        return generated_text
+        self._update_history(user_input, generated_text)
+
+
+def _make_async_queue_streamer(tokenizer, loop, queue):
+    """创建把解码文本推入 asyncio.Queue 的 streamer，生成结束时推入 None"""
+    from transformers import TextStreamer
+    
+    class AsyncQueueStreamer(TextStreamer):
+        def on_finalized_text(self, text, stream_end=False):
+            loop.call_soon_threadsafe(queue.put_nowait, text)
+            if stream_end:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+    
+    return AsyncQueueStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
 
 if __name__ == "__main__":
     chatbot = QwenChatbot()
@@ -5,10 +5,8 @@ Qwen3思考模式人物名称提取器
 使用思考模式分析中文古代小说文本，提取人物名称并记录推理过程
 """
 
-import json
 import re
 import sys
-import torch
 from pathlib import Path
 from typing import List, Dict, Optional
 from datetime import datetime
@@ -18,9 +16,83 @@ current_dir = Path(__file__).parent
 project_root = current_dir.parent.parent
 sys.path.insert(0, str(project_root))
 
-from steps.step03_character.character_extractor import QwenCharacterExtractor
+from steps.step03_character.character_extractor import QwenCharacterExtractor, dumps_result, read_text
 from utils.log_util import log_info, log_debug, log_warning, log_error
 
+# 模型输出中最终答案部分的起始标记
+ANSWER_MARKERS = ("最终答案：", "结论：", "人物名称：", "提取结果：", "答案：")
+# 所有答案标记合成一个正则，一次扫描找出各标记的出现位置
+_ANSWER_MARKER_RE = re.compile('|'.join(map(re.escape, ANSWER_MARKERS)))
+# 没有明确答案标记时，出现这些词的行视为进入答案部分
+_ANSWER_SECTION_HINT_RE = re.compile('人物|名称|角色|登场')
+# 判断是否以空行结尾时解码的末尾 token 数
+STOP_CHECK_TOKENS = 8
+
+# 思考模式人名提取提示词，待分析文本插在前缀与后缀之间
+NAME_PROMPT_PREFIX = """你是一个专业的中文古代小说分析专家。请仔细分析以下文本，提取所有人物姓名。
+
+请按以下步骤思考：
+
+1. 首先分析文本的基本结构和写作风格
+2. 识别对话、叙述和描写的不同部分
+3. 查找人物出现的线索（对话标识、称谓、动作描述等）
+4. 区分真实人物姓名和代词、称谓
+5. 验证提取的名称是否合理
+
+思考过程：
+[请详细记录你的分析思路]
+
+最终答案：
+[列出提取的人物姓名，每行一个]
+
+文本内容：
+"""
+NAME_PROMPT_SUFFIX = '\n\n请开始分析：'
+# 人物关系分析提示词，依次插入已识别的人物和待分析文本
+RELATION_PROMPT_HEAD = '请分析以下文本中人物之间的关系。\n\n已识别的人物：'
+RELATION_PROMPT_MIDDLE = """
+
+请按以下步骤思考：
+1. 分析文本中人物之间的互动情况
+2. 识别亲属关系、社会关系、情感关系
+3. 注意称谓和对话中体现的关系线索
+4. 总结主要的人物关系网络
+
+思考过程：
+[详细分析人物关系的推理过程]
+
+最终答案：
+[格式：人物A - 关系类型 - 人物B，每行一个关系]
+
+文本内容：
+"""
+RELATION_PROMPT_SUFFIX = '\n\n请开始分析：'
+
+
+def build_answer_stopping_criteria(tokenizer, prompt_length: int):
+    """
+    构建提前停止条件：最后一个答案标记之后已有内容且输出以空行结尾时停止生成
+    
+    答案列表写完后模型往往还会继续输出补充说明，每多生成一个 token 都是一次完整的前向计算。
+    每步只解码末尾几个 token 判断是否出现空行，出现时才解码全部新生成内容查找答案标记
+    """
+    from transformers import StoppingCriteria, StoppingCriteriaList
+    
+    class StopAfterAnswer(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            generated = input_ids[0, prompt_length:]
+            if not tokenizer.decode(generated[-STOP_CHECK_TOKENS:], skip_special_tokens=True).endswith('\n\n'):
+                return False
+            text = tokenizer.decode(generated, skip_special_tokens=True)
+            # 以最后一个答案标记为准，标记之后已经写出内容再停止，
+            # 避免 "最终答案：\n\n" 这样标记后紧跟空行时在第一个名字之前就停止
+            last_marker = None
+            for last_marker in _ANSWER_MARKER_RE.finditer(text):
+                pass
+            return last_marker is not None and bool(text[last_marker.end():].strip())
+    
+    return StoppingCriteriaList([StopAfterAnswer()])
+
 
 class QwenThinkExtractor(QwenCharacterExtractor):
     """
@@ -40,6 +112,8 @@ class QwenThinkExtractor(QwenCharacterExtractor):
         Returns:
             Dict包含 'thinking' 和 'answer' 两部分
         """
+        import torch
+        
         if not self.model or not self.tokenizer:
             if not self.load_model():
                 return {"thinking": "", "answer": ""}
@@ -57,20 +131,23 @@ class QwenThinkExtractor(QwenCharacterExtractor):
                 max_length=2048
             ).to(self.device)
             log_info(f"prompt:{prompt}")
-            # 生成回应
-            with torch.no_grad():
+            # 生成回应（inference_mode 比 no_grad 更进一步，省去张量版本计数等自动求导记录）；
+            # 提取任务使用贪心解码，结果稳定且无需采样开销，答案写完即提前停止
+            prompt_length = inputs["input_ids"].shape[1]
+            with torch.inference_mode():
                 outputs = self.model.generate(
                     **inputs,
-                    max_length=inputs["input_ids"].shape[1] + max_length,
-                    temperature=model_config.get("temperature", 0.7),
-                    do_sample=model_config.get("do_sample", True),
+                    max_new_tokens=max_length,
+                    do_sample=False,
+                    num_beams=1,
+                    stopping_criteria=build_answer_stopping_criteria(self.tokenizer, prompt_length),
                     pad_token_id=self.tokenizer.eos_token_id,
                     eos_token_id=self.tokenizer.eos_token_id
                 )
             
             # 解码输出
             full_response = self.tokenizer.decode(
-                outputs[0][inputs["input_ids"].shape[1]:],
+                outputs[0][prompt_length:],
                 skip_special_tokens=True
             ).strip()
             log_info(f"response:{full_response}",)
@@ -91,21 +168,20 @@ class QwenThinkExtractor(QwenCharacterExtractor):
         """
         解析模型输出，分离思考过程和最终答案
         """
-        # 查找思考标记
-        thinking_markers = ["思考过程：", "分析：", "让我分析", "首先", "步骤", "推理："]
-        answer_markers = ["最终答案：", "结论：", "人物名称：", "提取结果：", "答案："]
-        
         thinking_part = ""
         answer_part = ""
         
-        # 尝试分离思考和答案部分
-        for marker in answer_markers:
-            if marker in response:
-                parts = response.split(marker, 1)
-                if len(parts) == 2:
-                    thinking_part = parts[0].strip()
-                    answer_part = parts[1].strip()
-                    break
+        # 尝试分离思考和答案部分：一次扫描记录每个标记首次出现的位置，
+        # 再按 ANSWER_MARKERS 的优先级选择分隔标记
+        first_positions = {}
+        for match in _ANSWER_MARKER_RE.finditer(response):
+            first_positions.setdefault(match.group(), match.start())
+        for marker in ANSWER_MARKERS:
+            if marker in first_positions:
+                position = first_positions[marker]
+                thinking_part = response[:position].strip()
+                answer_part = response[position + len(marker):].strip()
+                break
         
         # 如果没有找到明确分隔符，使用启发式方法
         if not answer_part:
@@ -120,7 +196,7 @@ class QwenThinkExtractor(QwenCharacterExtractor):
                     continue
                     
                 # 判断是否进入答案部分
-                if any(marker in line.lower() for marker in ["人物", "名称", "角色", "登场"]):
+                if not in_answer_section and _ANSWER_SECTION_HINT_RE.search(line):
                     in_answer_section = True
                 
                 if in_answer_section:
@@ -148,26 +224,7 @@ class QwenThinkExtractor(QwenCharacterExtractor):
             log_debug(f"文本过长，截取前{chunk_size}字符进行分析")
         
         # 设计思考模式的提示词
-        prompt = f"""你是一个专业的中文古代小说分析专家。请仔细分析以下文本，提取所有人物姓名。
-
-请按以下步骤思考：
-
-1. 首先分析文本的基本结构和写作风格
-2. 识别对话、叙述和描写的不同部分
-3. 查找人物出现的线索（对话标识、称谓、动作描述等）
-4. 区分真实人物姓名和代词、称谓
-5. 验证提取的名称是否合理
-
-思考过程：
-[请详细记录你的分析思路]
-
-最终答案：
-[列出提取的人物姓名，每行一个]
-
-文本内容：
-{text}
-
-请开始分析："""
+        prompt = "".join((NAME_PROMPT_PREFIX, text, NAME_PROMPT_SUFFIX))
         
         # 调用思考模式生成
         response_dict = self.generate_response_with_thinking(prompt, max_length=1024)
@@ -206,14 +263,13 @@ class QwenThinkExtractor(QwenCharacterExtractor):
         self.thinking_logs.append(thinking_log)
         
         # 过滤和验证人名
-        filtered_names = []
         log_info("开始验证提取的人物名称：")
-        for name in names:
-            is_valid = self.is_valid_name(name)
-            log_debug(f"验证 '{name}': {'✓' if is_valid else '✗'}")
-            if is_valid:
-                filtered_names.append(name)
-        
+        valid_mask = [self.is_valid_name(name) for name in names]
+        filtered_names = [name for name, is_valid in zip(names, valid_mask) if is_valid]
+        rejected_names = [name for name, is_valid in zip(names, valid_mask) if not is_valid]
+        if rejected_names:
+            log_debug(f"未通过验证的名称({len(rejected_names)}个): {rejected_names}")
+
         log_info(f"最终确认的人物名称({len(filtered_names)}个): {filtered_names}")
         
         return {
@@ -235,26 +291,7 @@ class QwenThinkExtractor(QwenCharacterExtractor):
         
         # 构建关系分析提示词
         names_str = "、".join(names)
-        prompt = f"""请分析以下文本中人物之间的关系。
-
-已识别的人物：{names_str}
-
-请按以下步骤思考：
-1. 分析文本中人物之间的互动情况
-2. 识别亲属关系、社会关系、情感关系
-3. 注意称谓和对话中体现的关系线索
-4. 总结主要的人物关系网络
-
-思考过程：
-[详细分析人物关系的推理过程]
-
-最终答案：
-[格式：人物A - 关系类型 - 人物B，每行一个关系]
-
-文本内容：
-{text[:1000]}
-
-请开始分析："""
+        prompt = "".join((RELATION_PROMPT_HEAD, names_str, RELATION_PROMPT_MIDDLE, text[:1000], RELATION_PROMPT_SUFFIX))
         
         response_dict = self.generate_response_with_thinking(prompt)
         thinking = response_dict.get("thinking", "")
@@ -306,8 +343,7 @@ class QwenThinkExtractor(QwenCharacterExtractor):
         
         try:
             # 读取文件内容
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = read_text(file_path)
             
             log_info(f"文件读取成功，内容长度: {len(content)} 字符")
             
@@ -357,8 +393,8 @@ class QwenThinkExtractor(QwenCharacterExtractor):
             output_path = output_dir / f"qwen_think_analysis_{timestamp}.json"
         
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(report, f, ensure_ascii=False, indent=2)
+            with open(output_path, 'wb') as f:
+                f.write(dumps_result(report))
             
             log_info(f"分析报告已保存: {output_path}")
             
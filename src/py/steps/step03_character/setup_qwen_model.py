@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Qwen模型环境准备与模型管理
+"""
+
+import os
+import sys
+import json
+import hashlib
+import subprocess
+from importlib.util import find_spec
+from pathlib import Path
+
+from utils.constants import REQUIREMENTS_FILE
+from utils.log_util import log_info, log_warning, log_error
+
+# 优先使用 xxhash 校验模型文件（速度远高于 SHA256），未安装时使用 hashlib.blake2b
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+# 默认模型
+DEFAULT_MODEL_NAME = "Qwen/Qwen3-8B"
+# 并行下载的文件数
+DOWNLOAD_WORKERS = 8
+# 模型文件清单文件名，保存在模型存储目录下
+MANIFEST_FILE = "model_manifest.json"
+# 计算文件摘要时每次读取的块大小
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def install_dependencies(requirements_file=REQUIREMENTS_FILE):
+    """
+    安装项目依赖
+
+    所有依赖交给一次 pip 调用统一解析和下载，不再逐个包启动 pip 进程
+
+    Args:
+        requirements_file: 依赖列表文件路径
+
+    Returns:
+        bool: 安装是否成功
+    """
+    if not os.path.exists(requirements_file):
+        log_error(f"依赖文件不存在: {requirements_file}")
+        return False
+
+    # 跳过每次调用时 pip 的版本自检
+    env = dict(os.environ, PIP_DISABLE_PIP_VERSION_CHECK='1')
+    command = [sys.executable, '-m', 'pip', 'install', '--upgrade', '--prefer-binary',
+               '-r', str(requirements_file)]
+
+    log_info(f"开始安装依赖: {requirements_file}")
+    try:
+        subprocess.check_call(command, env=env)
+    except subprocess.CalledProcessError as e:
+        log_error(f"依赖安装失败: {e}")
+        return False
+
+    log_info("依赖安装完成")
+    return True
+
+
+def download_model(source="modelscope", model_name=DEFAULT_MODEL_NAME, model_dir="./models"):
+    """
+    下载模型文件到本地缓存目录
+
+    只拉取文件，不实例化模型，避免下载阶段把整份权重加载进内存
+
+    Args:
+        source: 下载源，huggingface 或 modelscope
+        model_name: 模型名称
+        model_dir: 模型存储目录
+
+    Returns:
+        str: 模型本地目录，下载失败时返回None
+    """
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    log_info(f"开始从 {source} 下载模型: {model_name}")
+    try:
+        if source == "huggingface":
+            # 已安装 hf_transfer 时启用其并行分段下载，需在导入 huggingface_hub 前设置
+            if find_spec("hf_transfer") is not None:
+                os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+            from huggingface_hub import snapshot_download
+            local_dir = snapshot_download(repo_id=model_name, cache_dir=str(model_dir),
+                                          max_workers=DOWNLOAD_WORKERS)
+        elif source == "modelscope":
+            from modelscope import snapshot_download
+            local_dir = snapshot_download(model_name, cache_dir=str(model_dir))
+        else:
+            log_error(f"不支持的下载源: {source}")
+            return None
+    except Exception as e:
+        log_error(f"模型下载失败: {e}")
+        return None
+
+    log_info(f"模型下载完成: {local_dir}")
+    write_manifest(local_dir, model_name, model_dir)
+    return local_dir
+
+
+def _hash_algorithm():
+    """当前环境使用的文件摘要算法名"""
+    return "xxh64" if XXHASH_AVAILABLE else "blake2b"
+
+
+def _file_digest(file_path, algorithm):
+    """按块计算文件摘要"""
+    if algorithm == "xxh64":
+        hasher = xxhash.xxh64()
+    else:
+        hasher = hashlib.new(algorithm)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def write_manifest(local_dir, model_name=DEFAULT_MODEL_NAME, model_dir="./models"):
+    """
+    记录模型目录下每个文件的大小、修改时间和摘要，供 verify_model 快速校验
+
+    Args:
+        local_dir: 模型本地目录
+        model_name: 模型名称
+        model_dir: 模型存储目录，清单文件保存在此目录下
+
+    Returns:
+        Path: 清单文件路径
+    """
+    local_dir = Path(local_dir)
+    algorithm = _hash_algorithm()
+    files = {}
+    for file_path in sorted(local_dir.rglob('*')):
+        if not file_path.is_file():
+            continue
+        stat = file_path.stat()
+        files[file_path.relative_to(local_dir).as_posix()] = [
+            stat.st_size, stat.st_mtime_ns, _file_digest(file_path, algorithm)
+        ]
+
+    manifest_file = Path(model_dir) / MANIFEST_FILE
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'local_dir': str(local_dir.resolve()),
+            'algorithm': algorithm,
+            'files': files
+        }, f, ensure_ascii=False, indent=2)
+
+    log_info(f"模型文件清单已保存: {manifest_file}（{len(files)} 个文件）")
+    return manifest_file
+
+
+def verify_model(model_dir="./models", deep=False):
+    """
+    按清单校验模型文件
+
+    逐个比对文件大小，只有修改时间与清单不同的文件才重新计算摘要；
+    deep 为 True 时额外加载分词器，确认文件可以被 transformers 正常读取
+
+    Args:
+        model_dir: 模型存储目录
+        deep: 是否加载分词器做深度校验
+
+    Returns:
+        bool: 校验是否通过
+    """
+    manifest_file = Path(model_dir) / MANIFEST_FILE
+    if not manifest_file.exists():
+        log_error(f"模型文件清单不存在，请先下载模型: {manifest_file}")
+        return False
+
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    local_dir = Path(manifest['local_dir'])
+    algorithm = manifest['algorithm']
+    if algorithm == "xxh64" and not XXHASH_AVAILABLE:
+        log_error("清单使用 xxh64 摘要，但当前环境未安装 xxhash")
+        return False
+
+    failed = []
+    for rel_path, (size, mtime_ns, digest) in manifest['files'].items():
+        file_path = local_dir / rel_path
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            failed.append(f"{rel_path}: 文件不存在")
+            continue
+        if stat.st_size != size:
+            failed.append(f"{rel_path}: 文件大小不一致")
+            continue
+        if stat.st_mtime_ns != mtime_ns and _file_digest(file_path, algorithm) != digest:
+            failed.append(f"{rel_path}: 文件摘要不一致")
+
+    if failed:
+        for message in failed:
+            log_warning(message)
+        log_error(f"模型校验失败: {len(failed)} 个文件异常")
+        return False
+
+    if deep:
+        try:
+            from transformers import AutoTokenizer
+            AutoTokenizer.from_pretrained(str(local_dir))
+        except Exception as e:
+            log_error(f"分词器加载失败: {e}")
+            return False
+
+    log_info(f"模型校验通过: {manifest['model_name']}（{len(manifest['files'])} 个文件）")
+    return True
+
+
+def model_info(model_dir="./models"):
+    """
+    输出模型文件清单和模型状态：模型名称、本地目录、文件数与总大小、缺失或大小不一致的文件数，
+    以及推理依赖是否已安装。只比对文件大小，不计算摘要，完整校验请使用 verify_model
+
+    Args:
+        model_dir: 模型存储目录
+
+    Returns:
+        bool: 是否找到模型文件清单
+    """
+    for package in ("torch", "transformers", "modelscope"):
+        log_info(f"依赖 {package}: {'已安装' if find_spec(package) else '未安装'}")
+
+    manifest_file = Path(model_dir) / MANIFEST_FILE
+    if not manifest_file.exists():
+        log_warning(f"模型文件清单不存在，模型尚未下载: {manifest_file}")
+        return False
+
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    local_dir = Path(manifest['local_dir'])
+    files = manifest['files']
+    total_size = sum(size for size, _, _ in files.values())
+    log_info(f"模型名称: {manifest['model_name']}")
+    log_info(f"本地目录: {local_dir}")
+    log_info(f"文件清单: {manifest_file}（{len(files)} 个文件，共 {total_size / 1024**3:.2f} GB，摘要算法 {manifest['algorithm']}）")
+
+    missing = changed = 0
+    for rel_path, (size, _, _) in files.items():
+        try:
+            if (local_dir / rel_path).stat().st_size != size:
+                changed += 1
+        except FileNotFoundError:
+            missing += 1
+    if missing or changed:
+        log_warning(f"模型状态: {missing} 个文件缺失，{changed} 个文件大小不一致")
+    else:
+        log_info("模型状态: 文件齐全")
+    return True
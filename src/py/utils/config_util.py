@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+项目配置读取工具
+"""
+
+import json
+from functools import lru_cache
+
+from utils.constants import CONFIG_FILE
+from utils.log_util import log_warning
+
+
+@lru_cache(maxsize=None)
+def load_config_section(section: str) -> dict:
+    """
+    读取项目配置文件 config.json 中的指定配置段，结果在进程内缓存
+
+    Args:
+        section: 配置段名称，如 "model"、"extraction"、"output"
+
+    Returns:
+        dict: 配置段内容，文件不存在、无法解析或没有该配置段时返回空字典
+    """
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f).get(section, {})
+    except (OSError, ValueError) as e:
+        log_warning(f"读取配置文件失败，使用默认{section}配置: {e}")
+        return {}
@@ -13,6 +13,7 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 OUTPUT_DIR = PROJECT_ROOT / "output"
 REQUIREMENTS_FILE = PROJECT_ROOT / "requirements.txt"
+CONFIG_FILE = PROJECT_ROOT / "config.json"
 
 # 确保目录存在
 OUTPUT_DIR.mkdir(exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试章节结构识别对全角空格分隔标题的支持
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root / "src" / "py"))
+
+from steps.step02_chapter.chapter_visualizer import ChapterScanner, ChapterStructureVisualizer, VOLUME, CHAPTER
+
+
+def test_fullwidth_space_header():
+    """测试以全角空格（U+3000）分隔编号和标题、以全角数字编号的卷章标题"""
+    scanner = ChapterScanner()
+    assert scanner.match("第一卷　开端") == (VOLUME, "一", "开端")
+    assert scanner.match("第一章　初见") == (CHAPTER, "一", "初见")
+    assert scanner.match("第１２章　再会") == (CHAPTER, "１２", "再会")
+
+    text = "第一卷　开端\n第一章　初见\n正文一\n第二章　再会\n正文二\n"
+    structure = ChapterStructureVisualizer().parse_buffer(text.encode("utf-8"), "test.txt")
+    volumes = structure["volumes"]
+    assert len(volumes) == 1
+    assert volumes[0].title == "开端"
+    assert [(chapter.chapter_number, chapter.chapter_title) for chapter in volumes[0].chapters] == [
+        (1, "初见"), (2, "再会")
+    ]
+    print("✅ 全角空格分隔的标题识别正确")
+    return True
+
+
+if __name__ == "__main__":
+    test_fullwidth_space_header()